@@ -1,56 +1,107 @@
 import streamlit as st
-import json
-import os
 from datetime import datetime
+import datos
+import notificador
+from datos import cargar_indice_alertas
 
-ALERTAS_FILE = "data/alertas_pendientes.json"
-HISTORIAL_ALERTAS = "data/alertas_atendidas.json"
+INTERVALO_ALERTAS_S = 2  # cada cuánto el panel revisa si hay alertas nuevas (en memoria)
+MAX_ALERTAS_PANEL = 15   # el resto se resume en un contador
 
-def cargar_alertas_pendientes():
-    if os.path.exists(ALERTAS_FILE):
-        with open(ALERTAS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+# Reglas de ruteo: (rol, alcance, tipos de alerta). alcance "todas" = toda la
+# planta, "asignada" = solo la etapa del usuario. tipos None = cualquier tipo.
+# Cada usuario ve además las alertas que él mismo reportó (sin poder atenderlas
+# si ninguna regla se las asigna).
+REGLAS_ALERTAS = [
+    ("administrador", "todas", None),
+    ("planificador", "todas", ("Falta de material o sin OP física",)),
+    ("trabajador", "asignada", None),
+]
 
-def guardar_alertas_pendientes(alertas):
-    with open(ALERTAS_FILE, "w", encoding="utf-8") as f:
-        json.dump(alertas, f, indent=2, ensure_ascii=False)
+def reglas_de(rol):
+    return [(alcance, tipos) for rol_regla, alcance, tipos in REGLAS_ALERTAS if rol_regla == rol]
 
-def registrar_alerta_atendida(alerta, usuario):
-    alerta_atendida = alerta.copy()
-    alerta_atendida["atendida_por"] = usuario
-    alerta_atendida["fecha_atendida"] = datetime.now().isoformat()
+def corresponde(alerta, rol, etapa):
+    # True si alguna regla del rol asigna la alerta al usuario
+    for alcance, tipos in reglas_de(rol):
+        if alcance == "asignada" and (not etapa or alerta.get("etapa") != etapa):
+            continue
+        if tipos is None or alerta.get("tipo_alerta") in tipos:
+            return True
+    return False
 
-    historial = []
-    if os.path.exists(HISTORIAL_ALERTAS):
-        with open(HISTORIAL_ALERTAS, "r", encoding="utf-8") as f:
-            historial = json.load(f)
+def alertas_de_usuario(indice, usuario, rol, etapa):
+    # Toma los candidatos del índice (no recorre todas las alertas salvo que
+    # una regla abarque toda la planta sin filtro de tipo)
+    candidatas = list(indice.por_usuario(usuario))
+    for alcance, tipos in reglas_de(rol):
+        if alcance == "asignada":
+            candidatas.extend(indice.por_etapa(etapa) if etapa else [])
+        elif tipos is None:
+            candidatas.extend(indice.todas())
+        else:
+            for tipo in tipos:
+                candidatas.extend(indice.por_tipo(tipo))
 
-    historial.append(alerta_atendida)
+    seleccion = {}
+    for alerta in candidatas:
+        if alerta["id"] not in seleccion and (alerta.get("usuario") == usuario or corresponde(alerta, rol, etapa)):
+            seleccion[alerta["id"]] = alerta
+    return [seleccion[i] for i in sorted(seleccion)]
 
-    with open(HISTORIAL_ALERTAS, "w", encoding="utf-8") as f:
-        json.dump(historial, f, indent=2, ensure_ascii=False)
+def registrar_alerta_atendida(alerta, usuario, rol=None, etapa=None):
+    # Una sola escritura: la alerta pasa de pendientes a atendidas por su id y,
+    # si era la última de la OP, se limpia su color_alerta.
+    # Solo la atiende un usuario al que las reglas se la asignan.
+    if rol is not None and not corresponde(alerta, rol, etapa):
+        return None
+    return datos.atender_alerta(alerta["id"], {
+        "atendida_por": usuario,
+        "fecha_atendida": datetime.now().isoformat(),
+    })
 
 def mostrar_notificaciones(usuario):
     with st.sidebar:
-        st.markdown("---")
-        st.markdown("### 🔔 Notificaciones")
-
-        alertas = cargar_alertas_pendientes()
-        nuevas_alertas = []
-
-        for i, alerta in enumerate(alertas):
-            col1, col2 = st.columns([5, 1])
-            with col1:
-                msg = f"🚨 OP {alerta['numero_op']} - {alerta['tipo_alerta'].upper()} - Etapa: {alerta['etapa']} ({alerta['fecha'][:16].replace('T',' ')})"
-                st.error(msg)
-            with col2:
-                if st.button("✔️", key=f"atender_{i}"):
-                    registrar_alerta_atendida(alerta, usuario)
-                    continue  # No se agrega de nuevo
-                nuevas_alertas.append(alerta)
-
-        guardar_alertas_pendientes(nuevas_alertas)
-
-        if not nuevas_alertas:
-            st.info("No hay notificaciones nuevas.")
+        panel_notificaciones(usuario, st.session_state.get("rol"), st.session_state.get("etapa"))
+
+def alertas_actuales(usuario, rol, etapa):
+    # Relee las alertas solo si el notificador avisó un cambio desde la última
+    # vez que esta sesión las vio; avisa con un toast las alertas nuevas.
+    clave = (notificador.version("alertas_pendientes"), usuario, rol, etapa)
+    vistas = st.session_state.get("alertas_vistas")
+    if vistas is not None and vistas[0] == clave:
+        return vistas[1]
+
+    alertas = alertas_de_usuario(cargar_indice_alertas(), usuario, rol, etapa)
+    if vistas is not None:
+        ids_vistos = {a["id"] for a in vistas[1]}
+        for alerta in alertas:
+            if alerta["id"] not in ids_vistos and alerta.get("usuario") != usuario:
+                st.toast(f"🚨 OP {alerta['numero_op']}: {alerta['tipo_alerta']} ({alerta['etapa']})")
+    st.session_state["alertas_vistas"] = (clave, alertas)
+    return alertas
+
+@st.fragment(run_every=INTERVALO_ALERTAS_S)
+def panel_notificaciones(usuario, rol, etapa):
+    # Fragmento de solo lectura: se redibuja solo (sin rerun de la página) y
+    # atender una alerta es la única acción que escribe.
+    st.markdown("---")
+    st.markdown("### 🔔 Notificaciones")
+
+    alertas = alertas_actuales(usuario, rol, etapa)
+    if not alertas:
+        st.info("No hay notificaciones nuevas.")
+        return
+
+    # Las más recientes primero
+    for alerta in reversed(alertas[-MAX_ALERTAS_PANEL:]):
+        col1, col2 = st.columns([5, 1])
+        with col2:
+            if corresponde(alerta, rol, etapa) and st.button("✔️", key=f"atender_{alerta['id']}"):
+                registrar_alerta_atendida(alerta, usuario, rol, etapa)
+                continue
+        with col1:
+            msg = f"🚨 OP {alerta['numero_op']} - {alerta['tipo_alerta'].upper()} - Etapa: {alerta['etapa']} ({alerta['fecha'][:16].replace('T',' ')})"
+            st.error(msg)
+
+    if len(alertas) > MAX_ALERTAS_PANEL:
+        st.caption(f"… y {len(alertas) - MAX_ALERTAS_PANEL} alertas más antiguas")
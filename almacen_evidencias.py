@@ -0,0 +1,115 @@
+# ------------------ Almacén de evidencias por contenido ------------------ #
+# Las fotos de evidencia se guardan como evidencias/<sha256>.<ext>: la misma
+# foto subida varias veces ocupa un solo archivo. La subida se copia a disco
+# por bloques mientras se calcula el hash (nunca entera en memoria) y las fotos
+# de celular demasiado grandes se reducen al guardarlas.
+#
+# Las referencias (alertas y eventos que usan cada archivo) se cuentan en la
+# tabla evidencias de almacenamiento.py. Los archivos sin referencias se
+# eliminan con:  python almacen_evidencias.py gc [--aplicar]
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from PIL import Image, ImageOps
+import almacenamiento
+import medios
+
+EVIDENCIA_DIR = "evidencias"
+MAX_BYTES_EVIDENCIA = 15 * 1024 * 1024
+TAMANO_BLOQUE = 1024 * 1024
+LADO_MAX = 2048            # px; las fotos más grandes se reducen al guardarlas
+CALIDAD_JPEG = 85
+GRACIA_GC_HORAS = 24       # no se borran archivos recién subidos aún sin referencia
+
+class EvidenciaDemasiadoGrande(ValueError):
+    pass
+
+def _reducir(ruta, extension):
+    # Reduce en el lugar las imágenes que superan LADO_MAX (mismo formato)
+    try:
+        with Image.open(ruta) as imagen:
+            if max(imagen.size) <= LADO_MAX:
+                return
+            # El temporal termina en .tmp: el formato se toma del original,
+            # porque las copias transformadas ya no lo conservan
+            formato = imagen.format
+            imagen = ImageOps.exif_transpose(imagen)
+            imagen.thumbnail((LADO_MAX, LADO_MAX))
+            if formato == "JPEG" or extension in (".jpg", ".jpeg"):
+                if imagen.mode not in ("RGB", "L"):
+                    imagen = imagen.convert("RGB")
+                imagen.save(ruta, "JPEG", quality=CALIDAD_JPEG, optimize=True)
+            else:
+                imagen.save(ruta, formato, optimize=True)
+    except (OSError, ValueError):
+        pass  # no es una imagen que Pillow pueda abrir o reescribir: se guarda tal cual
+
+def guardar(archivo):
+    # Guarda un archivo subido (st.file_uploader) y devuelve su nombre en EVIDENCIA_DIR
+    if getattr(archivo, "size", 0) > MAX_BYTES_EVIDENCIA:
+        raise EvidenciaDemasiadoGrande(f"La evidencia supera {MAX_BYTES_EVIDENCIA // (1024 * 1024)} MB")
+
+    os.makedirs(EVIDENCIA_DIR, exist_ok=True)
+    extension = os.path.splitext(archivo.name)[1].lower() or ".jpg"
+    descriptor, temporal = tempfile.mkstemp(dir=EVIDENCIA_DIR, suffix=".tmp")
+    try:
+        sha = hashlib.sha256()
+        tamano = 0
+        archivo.seek(0)
+        with os.fdopen(descriptor, "wb") as f:
+            while True:
+                bloque = archivo.read(TAMANO_BLOQUE)
+                if not bloque:
+                    break
+                tamano += len(bloque)
+                if tamano > MAX_BYTES_EVIDENCIA:
+                    raise EvidenciaDemasiadoGrande(f"La evidencia supera {MAX_BYTES_EVIDENCIA // (1024 * 1024)} MB")
+                sha.update(bloque)
+                f.write(bloque)
+
+        nombre = f"{sha.hexdigest()}{extension}"
+        destino = os.path.join(EVIDENCIA_DIR, nombre)
+        if os.path.exists(destino):
+            os.remove(temporal)  # ya estaba guardada
+        else:
+            _reducir(temporal, extension)
+            os.replace(temporal, destino)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    almacenamiento.registrar_evidencia(nombre, os.path.getsize(destino))
+    medios.registrar(destino)
+    return nombre
+
+def recolectar(aplicar=False, gracia_horas=GRACIA_GC_HORAS):
+    # Recalcula las referencias y elimina (si aplicar=True) los archivos huérfanos
+    referencias = almacenamiento.recontar_evidencias()
+    limite = time.time() - gracia_horas * 3600
+    huerfanos = []
+    if os.path.isdir(EVIDENCIA_DIR):
+        for nombre in sorted(os.listdir(EVIDENCIA_DIR)):
+            ruta = os.path.join(EVIDENCIA_DIR, nombre)
+            if not os.path.isfile(ruta) or referencias.get(nombre, 0) > 0:
+                continue
+            if os.path.getmtime(ruta) > limite:
+                continue
+            huerfanos.append(ruta)
+            if aplicar:
+                os.remove(ruta)
+    if aplicar:
+        almacenamiento.quitar_evidencias([os.path.basename(r) for r in huerfanos])
+    return huerfanos
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["gc"]:
+        print("Uso: python almacen_evidencias.py gc [--aplicar]")
+        sys.exit(1)
+    aplicar = "--aplicar" in sys.argv
+    huerfanos = recolectar(aplicar)
+    for ruta in huerfanos:
+        print(("eliminado: " if aplicar else "huérfano: ") + ruta)
+    print(f"{len(huerfanos)} archivo(s) sin referencias" + ("" if aplicar else " (use --aplicar para eliminarlos)"))
@@ -0,0 +1,738 @@
+# ------------------ Almacenamiento SQLite (modo WAL) ------------------ #
+# Reemplaza la reescritura completa de los archivos JSON de data/ por una base
+# SQLite transaccional. Cada OP o alerta es una fila: avanzar de etapa es un
+# UPDATE de una fila más un evento agregado a la bitácora, no un volcado de
+# toda la lista. Los eventos de trazabilidad viven en bitacora.py.
+import sqlite3
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import bitacora
+import cronometros
+import rollups
+
+DATA_DIR = "data"
+DB_FILE = os.path.join(DATA_DIR, "omlean.db")
+
+# Archivos JSON originales (solo se leen para la migración inicial)
+ETAPAS_JSON = os.path.join(DATA_DIR, "etapas.json")
+OPS_JSON = os.path.join(DATA_DIR, "ordenes_produccion.json")
+ALERTAS_PENDIENTES_JSON = os.path.join(DATA_DIR, "alertas_pendientes.json")
+ALERTAS_ATENDIDAS_JSON = os.path.join(DATA_DIR, "alertas_atendidas.json")
+
+POOL_MAX = 8
+
+# Columnas de ordenes_produccion que se guardan aparte del JSON para poder indexarlas
+COLUMNAS_OP = ("cliente", "producto", "estado_actual", "fecha_entrega")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+CREATE TABLE IF NOT EXISTS etapas (
+    posicion INTEGER PRIMARY KEY,
+    nombre TEXT,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ordenes_produccion (
+    numero_op TEXT PRIMARY KEY,
+    cliente TEXT,
+    producto TEXT,
+    estado_actual TEXT,
+    fecha_entrega TEXT,
+    fecha_creacion TEXT,
+    version INTEGER NOT NULL DEFAULT 1,
+    datos TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ops_estado ON ordenes_produccion(estado_actual);
+CREATE INDEX IF NOT EXISTS idx_ops_creacion ON ordenes_produccion(fecha_creacion);
+CREATE INDEX IF NOT EXISTS idx_ops_cliente ON ordenes_produccion(cliente, fecha_creacion);
+CREATE TABLE IF NOT EXISTS historial (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    numero_op TEXT NOT NULL,
+    etapa TEXT,
+    inicio TEXT,
+    fin TEXT,
+    duracion_min REAL,
+    observacion TEXT,
+    datos TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_historial_op ON historial(numero_op, id);
+CREATE TABLE IF NOT EXISTS alertas_pendientes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    numero_op TEXT,
+    etapa TEXT,
+    fecha TEXT,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS alertas_atendidas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    numero_op TEXT,
+    etapa TEXT,
+    fecha TEXT,
+    fecha_atendida TEXT,
+    datos TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS evidencias (
+    nombre TEXT PRIMARY KEY,
+    tamano INTEGER,
+    referencias INTEGER NOT NULL DEFAULT 0,
+    fecha_alta TEXT
+);
+"""
+
+class ConflictoVersion(Exception):
+    # La OP cambió (otro operario) desde que se leyó la versión indicada
+    pass
+
+_pool = queue.LifoQueue()
+_esquema_lock = threading.Lock()
+_esquema_listo = False
+
+# ------------------ Conexiones ------------------ #
+def _nueva_conexion():
+    os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+    # isolation_level=None: las transacciones se abren explícitamente con BEGIN
+    conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def inicializar():
+    # Crea el esquema y migra los JSON la primera vez. La conexión queda en el
+    # pool: mantener una conexión abierta conserva el archivo -wal entre usos.
+    global _esquema_listo
+    if _esquema_listo:
+        return
+    with _esquema_lock:
+        if _esquema_listo:
+            return
+        conn = _nueva_conexion()
+        try:
+            conn.executescript(ESQUEMA)
+            conn.executescript(rollups.ESQUEMA)
+            conn.executescript(cronometros.ESQUEMA)
+            _agregar_columnas(conn)
+            migrar_desde_json(conn)
+            migrar_rollups(conn)
+            migrar_evidencias(conn)
+        except BaseException:
+            conn.close()
+            raise
+        _pool.put(conn)
+        _esquema_listo = True
+
+@contextmanager
+def conexion():
+    inicializar()
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _nueva_conexion()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        if _pool.qsize() < POOL_MAX:
+            _pool.put(conn)
+        else:
+            conn.close()
+
+@contextmanager
+def transaccion():
+    # BEGIN IMMEDIATE toma el bloqueo de escritura al inicio: dos operarios
+    # escribiendo a la vez se serializan en lugar de pisarse los cambios.
+    with conexion() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+@contextmanager
+def lectura():
+    # Transacción de solo lectura: varias consultas ven la misma foto de la base
+    with conexion() as conn:
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+# ------------------ Conversión fila <-> dict ------------------ #
+def _a_json(valor):
+    return json.dumps(valor, ensure_ascii=False)
+
+def _op_a_fila(op):
+    datos = {k: v for k, v in op.items() if k not in ("historial", "version")}
+    historial = op.get("historial") or []
+    fecha_creacion = historial[0].get("inicio") if historial else None
+    return (
+        op["numero_op"],
+        op.get("cliente"),
+        op.get("producto"),
+        op.get("estado_actual"),
+        op.get("fecha_entrega"),
+        fecha_creacion,
+        _a_json(datos),
+    )
+
+def _historial_a_filas(numero_op, historial):
+    filas = []
+    for entrada in historial or []:
+        extras = {k: v for k, v in entrada.items() if k not in ("etapa", "inicio", "fin", "duracion_min", "observacion")}
+        filas.append((
+            numero_op,
+            entrada.get("etapa"),
+            entrada.get("inicio"),
+            entrada.get("fin"),
+            entrada.get("duracion_min"),
+            entrada.get("observacion"),
+            _a_json(extras) if extras else None,
+        ))
+    return filas
+
+def _fila_a_entrada_historial(fila):
+    entrada = {
+        "etapa": fila["etapa"],
+        "inicio": fila["inicio"],
+        "fin": fila["fin"],
+        "duracion_min": fila["duracion_min"],
+        "observacion": fila["observacion"],
+    }
+    if fila["datos"]:
+        entrada.update(json.loads(fila["datos"]))
+    return entrada
+
+def _fila_a_alerta(fila):
+    alerta = json.loads(fila["datos"])
+    alerta["id"] = fila["id"]
+    return alerta
+
+# ------------------ Etapas ------------------ #
+def cargar_etapas():
+    with conexion() as conn:
+        filas = conn.execute("SELECT datos FROM etapas ORDER BY posicion").fetchall()
+    return [json.loads(f["datos"]) for f in filas]
+
+def guardar_etapas(etapas):
+    # La lista de etapas es pequeña y se edita como tabla completa
+    with transaccion() as conn:
+        _reemplazar_etapas(conn, etapas)
+
+def _reemplazar_etapas(conn, etapas):
+    conn.execute("DELETE FROM etapas")
+    conn.executemany(
+        "INSERT INTO etapas (posicion, nombre, datos) VALUES (?, ?, ?)",
+        [(i, e.get("nombre"), _a_json(e)) for i, e in enumerate(etapas)],
+    )
+
+# ------------------ Órdenes de producción ------------------ #
+def cargar_ops():
+    with lectura() as conn:
+        filas_ops = conn.execute("SELECT numero_op, version, datos FROM ordenes_produccion ORDER BY rowid").fetchall()
+        filas_hist = conn.execute("SELECT * FROM historial ORDER BY numero_op, id").fetchall()
+
+    historiales = {}
+    for fila in filas_hist:
+        historiales.setdefault(fila["numero_op"], []).append(_fila_a_entrada_historial(fila))
+
+    ops = []
+    for fila in filas_ops:
+        op = json.loads(fila["datos"])
+        op["version"] = fila["version"]
+        op["historial"] = historiales.get(fila["numero_op"], [])
+        ops.append(op)
+    return ops
+
+# Columnas por las que se puede ordenar la consulta de historial
+ORDEN_HISTORIAL = {
+    "creacion": "o.fecha_creacion",
+    "numero_op": "h.numero_op",
+    "cliente": "o.cliente",
+    "producto": "o.producto",
+    "etapa": "h.etapa",
+    "inicio": "h.inicio",
+    "fin": "h.fin",
+    "duracion": "h.duracion_min",
+}
+
+def _filtros_historial(desde=None, hasta=None, cliente=None, producto=None, etapa=None, prefijo_op=None):
+    # Filtros resueltos en SQL; la fecha de creación y el número de OP usan índice
+    condiciones = []
+    parametros = []
+    if desde:
+        condiciones.append("o.fecha_creacion >= ?")
+        parametros.append(desde)
+    if hasta:
+        # fecha_creacion es ISO con hora: se compara contra el día siguiente
+        condiciones.append("o.fecha_creacion < date(?, '+1 day')")
+        parametros.append(hasta)
+    if cliente:
+        condiciones.append("o.cliente = ?")
+        parametros.append(cliente)
+    if producto:
+        condiciones.append("o.producto = ?")
+        parametros.append(producto)
+    if etapa:
+        condiciones.append("h.etapa = ?")
+        parametros.append(etapa)
+    if prefijo_op:
+        # Rango en lugar de LIKE para aprovechar la clave primaria
+        condiciones.append("o.numero_op >= ? AND o.numero_op < ?")
+        parametros.extend([prefijo_op, prefijo_op + "\U0010ffff"])
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return where, parametros
+
+CONSULTA_HISTORIAL = (
+    "SELECT h.numero_op, o.cliente, o.producto, h.etapa, h.inicio, h.fin, h.duracion_min, h.observacion, h.datos "
+    "FROM historial h JOIN ordenes_produccion o ON o.numero_op = h.numero_op "
+)
+
+def iterar_historial(desde=None, hasta=None, cliente=None, tamano_lote=500):
+    # Recorre las filas de historial filtradas sin cargar todo en memoria
+    where, parametros = _filtros_historial(desde, hasta, cliente)
+    with lectura() as conn:
+        cursor = conn.execute(
+            CONSULTA_HISTORIAL + where + " ORDER BY o.fecha_creacion, h.numero_op, h.id",
+            parametros,
+        )
+        while True:
+            filas = cursor.fetchmany(tamano_lote)
+            if not filas:
+                break
+            yield from filas
+
+def consultar_historial(filtros, orden="creacion", descendente=False, limite=50, desplazamiento=0):
+    # Una página de historial ya filtrada y ordenada, más el total de filas
+    where, parametros = _filtros_historial(**filtros)
+    direccion = "DESC" if descendente else "ASC"
+    with lectura() as conn:
+        total = conn.execute(
+            "SELECT COUNT(*) FROM historial h JOIN ordenes_produccion o ON o.numero_op = h.numero_op " + where,
+            parametros,
+        ).fetchone()[0]
+        filas = conn.execute(
+            CONSULTA_HISTORIAL + where
+            + f" ORDER BY {ORDEN_HISTORIAL[orden]} {direccion}, h.numero_op, h.id LIMIT ? OFFSET ?",
+            parametros + [limite, desplazamiento],
+        ).fetchall()
+    return total, [tuple(f) for f in filas]
+
+def existe_op(numero_op):
+    with conexion() as conn:
+        fila = conn.execute("SELECT 1 FROM ordenes_produccion WHERE numero_op=?", (numero_op,)).fetchone()
+    return fila is not None
+
+def _insertar_op(conn, op):
+    conn.execute(
+        "INSERT INTO ordenes_produccion (numero_op, cliente, producto, estado_actual, fecha_entrega, fecha_creacion, datos) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        _op_a_fila(op),
+    )
+    conn.executemany(
+        "INSERT INTO historial (numero_op, etapa, inicio, fin, duracion_min, observacion, datos) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        _historial_a_filas(op["numero_op"], op.get("historial")),
+    )
+
+def insertar_op(op):
+    # Lanza sqlite3.IntegrityError si el número de OP ya existe
+    with transaccion() as conn:
+        _insertar_op(conn, op)
+
+def _actualizar_op(conn, numero_op, cambios, version=None):
+    # Actualiza solo los campos indicados dentro del JSON (json_set) y sus
+    # columnas indexadas, en un único UPDATE de una fila. Con version, el
+    # UPDATE solo aplica si la OP sigue en esa versión (compare-and-swap) y,
+    # si no aplica, lanza ConflictoVersion: la OP cambió o ya no existe (p.
+    # ej. otro operario la dividió). Devuelve la nueva versión, o None si sin
+    # version la OP no existe.
+    rutas = []
+    valores = []
+    for clave, valor in cambios.items():
+        if isinstance(valor, (dict, list, bool)):
+            rutas.append(f"'$.\"{clave}\"', json(?)")
+            valores.append(_a_json(valor))
+        else:
+            rutas.append(f"'$.\"{clave}\"', ?")
+            valores.append(valor)
+
+    columnas = [c for c in COLUMNAS_OP if c in cambios]
+    asignaciones = [f"{c}=?" for c in columnas] + [f"datos=json_set(datos, {', '.join(rutas)})", "version=version+1"]
+    parametros = [cambios[c] for c in columnas] + valores + [numero_op]
+    condicion = "numero_op=?"
+    if version is not None:
+        condicion += " AND version=?"
+        parametros.append(version)
+    cursor = conn.execute(
+        f"UPDATE ordenes_produccion SET {', '.join(asignaciones)} WHERE {condicion}",
+        parametros,
+    )
+    if cursor.rowcount != 1:
+        if version is not None:
+            raise ConflictoVersion(numero_op)
+        return None
+    return conn.execute("SELECT version FROM ordenes_produccion WHERE numero_op=?", (numero_op,)).fetchone()[0]
+
+def actualizar_op(numero_op, cambios, version=None):
+    with transaccion() as conn:
+        return _actualizar_op(conn, numero_op, cambios, version)
+
+def guardar_planificacion(planes):
+    # planes: numero_op -> campos del planificador. Son datos derivados (nadie
+    # los edita a mano): se escriben sin subir la versión de la OP, para que
+    # replanificar no invalide lo que los operarios tienen en pantalla.
+    with transaccion() as conn:
+        conn.executemany(
+            "UPDATE ordenes_produccion SET datos=json_set(datos, "
+            "'$.planificacion', json(?), '$.fecha_fin_estimada', ?, '$.en_riesgo', json(?), '$.dias_restantes', ?) "
+            "WHERE numero_op=?",
+            [
+                (_a_json(p["planificacion"]), p["fecha_fin_estimada"], _a_json(p["en_riesgo"]), p["dias_restantes"], numero_op)
+                for numero_op, p in planes.items()
+            ],
+        )
+
+def _cambiar_entrada_historial(conn, numero_op, etapa_anterior, etapa_nueva, fecha):
+    # Cierra la entrada abierta (fin y minutos de estadía) y abre la de la
+    # nueva etapa. Devuelve los minutos en la etapa cerrada (o None). Si la
+    # entrada abierta es de otra etapa (historiales previos a este registro),
+    # su inicio no es el ingreso a etapa_anterior: se cierra sin duración.
+    abierta = conn.execute(
+        "SELECT id, etapa, inicio FROM historial WHERE numero_op=? AND fin IS NULL ORDER BY id DESC LIMIT 1",
+        (numero_op,),
+    ).fetchone()
+    duracion = None
+    if abierta is not None:
+        if abierta["etapa"] == etapa_anterior:
+            duracion = _minutos_entre(abierta["inicio"], fecha)
+        conn.execute("UPDATE historial SET fin=?, duracion_min=? WHERE id=?", (fecha, duracion, abierta["id"]))
+    conn.execute("INSERT INTO historial (numero_op, etapa, inicio) VALUES (?, ?, ?)", (numero_op, etapa_nueva, fecha))
+    return duracion
+
+def _minutos_entre(inicio, fin):
+    try:
+        return round((datetime.fromisoformat(fin) - datetime.fromisoformat(inicio)).total_seconds() / 60, 2)
+    except (TypeError, ValueError):
+        return None
+
+def _historial_de(conn, numero_op):
+    filas = conn.execute("SELECT * FROM historial WHERE numero_op=? ORDER BY id", (numero_op,)).fetchall()
+    return [_fila_a_entrada_historial(f) for f in filas]
+
+def avanzar_etapa(numero_op, cambios, evento, version=None):
+    # Cambio de etapa en una transacción: UPDATE de la OP, cierre/apertura de
+    # su historial y agregados de KPIs. El evento (con tiempo_estadia_min) se
+    # agrega a la bitácora antes del COMMIT. Con version, lanza
+    # ConflictoVersion si otro operario ya movió o dividió la OP.
+    # Devuelve los campos nuevos de la OP (version, historial) o None.
+    with transaccion() as conn:
+        nueva_version = _actualizar_op(conn, numero_op, cambios, version)
+        if not nueva_version:
+            return None
+        duracion = _cambiar_entrada_historial(
+            conn, numero_op, evento.get("etapa_anterior"), cambios["estado_actual"], evento["fecha"]
+        )
+        evento = dict(evento, tiempo_estadia_min=duracion)
+        # El cronómetro de la etapa que se deja es la medición de tiempo_total
+        minutos = cronometros.finalizar(conn, numero_op, evento.get("etapa_anterior"))
+        if minutos is not None and evento.get("datos_etapa") is not None:
+            evento["datos_etapa"] = dict(evento["datos_etapa"], tiempo_total=minutos)
+        resultado = {"version": nueva_version, "historial": _historial_de(conn, numero_op)}
+        _registrar_eventos(conn, [evento])
+    return resultado
+
+def dividir_op(numero_op, nuevas_ops, eventos, version=None):
+    with transaccion() as conn:
+        if version is None:
+            conn.execute("DELETE FROM ordenes_produccion WHERE numero_op=?", (numero_op,))
+        elif conn.execute(
+            "DELETE FROM ordenes_produccion WHERE numero_op=? AND version=?", (numero_op, version)
+        ).rowcount != 1:
+            raise ConflictoVersion(numero_op)
+        conn.execute("DELETE FROM historial WHERE numero_op=?", (numero_op,))
+        conn.execute("DELETE FROM cronometros WHERE numero_op=?", (numero_op,))
+        for op in nuevas_ops:
+            _insertar_op(conn, op)
+        _registrar_eventos(conn, eventos)
+
+# ------------------ Trazabilidad y KPIs ------------------ #
+def _actualizar_rollups(conn, eventos):
+    for evento in eventos:
+        if not evento.get("datos_etapa") and evento.get("tiempo_estadia_min") is None:
+            continue
+        fila = conn.execute(
+            "SELECT cliente, producto FROM ordenes_produccion WHERE numero_op=?", (evento.get("op"),)
+        ).fetchone()
+        rollups.actualizar(conn, evento, *(tuple(fila) if fila else (None, None)))
+
+def _registrar_eventos(conn, eventos):
+    # Último paso de la transacción: agregados y luego la bitácora, antes del
+    # COMMIT. Un corte antes de la línea no confirma nada; uno entre la línea
+    # y el COMMIT deja un evento de más en la bitácora, pero nunca falta en
+    # ella un cambio ya confirmado (los agregados se reconstruyen desde ahí).
+    _actualizar_rollups(conn, eventos)
+    bitacora.registrar_eventos(eventos)
+
+def registrar_evento(evento):
+    with transaccion() as conn:
+        _referenciar_evidencia(conn, evento.get("foto_nombre"))
+        _registrar_eventos(conn, [evento])
+
+def consultar_rollups(dimension, metrica, desde=None, hasta=None):
+    with lectura() as conn:
+        return rollups.consultar(conn, dimension, metrica, desde, hasta)
+
+# ------------------ Cronómetros de etapa ------------------ #
+def leer_cronometro(numero_op, etapa):
+    with conexion() as conn:
+        return cronometros.leer(conn, numero_op, etapa)
+
+def iniciar_cronometro(numero_op, etapa, usuario):
+    with transaccion() as conn:
+        cronometros.iniciar(conn, numero_op, etapa, usuario)
+
+def pausar_cronometro(numero_op, etapa):
+    with transaccion() as conn:
+        return cronometros.pausar(conn, numero_op, etapa)
+
+def detener_cronometro(numero_op, etapa):
+    with transaccion() as conn:
+        return cronometros.detener(conn, numero_op, etapa)
+
+# ------------------ Alertas ------------------ #
+def _insertar_alerta_pendiente(conn, alerta):
+    datos = {k: v for k, v in alerta.items() if k != "id"}
+    cursor = conn.execute(
+        "INSERT INTO alertas_pendientes (numero_op, etapa, fecha, datos) VALUES (?, ?, ?, ?)",
+        (datos.get("numero_op"), datos.get("etapa"), datos.get("fecha"), _a_json(datos)),
+    )
+    return cursor.lastrowid
+
+def _insertar_alerta_atendida(conn, alerta):
+    datos = {k: v for k, v in alerta.items() if k != "id"}
+    conn.execute(
+        "INSERT INTO alertas_atendidas (numero_op, etapa, fecha, fecha_atendida, datos) VALUES (?, ?, ?, ?, ?)",
+        (datos.get("numero_op"), datos.get("etapa"), datos.get("fecha"), datos.get("fecha_atendida"), _a_json(datos)),
+    )
+
+def cargar_alertas_pendientes():
+    with conexion() as conn:
+        filas = conn.execute("SELECT id, datos FROM alertas_pendientes ORDER BY id").fetchall()
+    return [_fila_a_alerta(f) for f in filas]
+
+def agregar_alerta_pendiente(alerta, cambios_op=None, evento=None):
+    # Registra la alerta, marca la OP y deja el evento en la bitácora en una sola transacción
+    with transaccion() as conn:
+        id_alerta = _insertar_alerta_pendiente(conn, alerta)
+        _referenciar_evidencia(conn, alerta.get("foto_nombre"))
+        if cambios_op:
+            _actualizar_op(conn, alerta["numero_op"], cambios_op)
+        if evento:
+            _referenciar_evidencia(conn, evento.get("foto_nombre"))
+            _registrar_eventos(conn, [evento])
+    return id_alerta
+
+def evidencias_de_ops(numeros_op):
+    # Fotos de las alertas (pendientes y atendidas) de las OPs indicadas, por fecha
+    numeros_op = list(numeros_op)
+    if not numeros_op:
+        return []
+    marcas = ", ".join("?" * len(numeros_op))
+    consulta = " UNION ALL ".join(
+        f"SELECT numero_op, etapa, fecha, json_extract(datos, '$.tipo_alerta') AS tipo_alerta, "
+        f"json_extract(datos, '$.foto_nombre') AS foto_nombre FROM {tabla} "
+        f"WHERE numero_op IN ({marcas}) AND json_extract(datos, '$.foto_nombre') <> ''"
+        for tabla in ("alertas_pendientes", "alertas_atendidas")
+    )
+    with conexion() as conn:
+        filas = conn.execute(consulta + " ORDER BY fecha", numeros_op * 2).fetchall()
+    return [dict(f) for f in filas]
+
+def atender_alerta(id_alerta, cambios):
+    # Mueve una alerta de pendientes a atendidas en una sola transacción y
+    # recalcula el color manual de la OP con las alertas que le quedan (None
+    # si no le queda ninguna). Devuelve (alerta, cambios de la OP o None), o
+    # (None, None) si otro usuario ya la atendió.
+    with transaccion() as conn:
+        fila = conn.execute("SELECT id, datos FROM alertas_pendientes WHERE id=?", (id_alerta,)).fetchone()
+        if fila is None:
+            return None, None
+        alerta = _fila_a_alerta(fila)
+        alerta.update(cambios)
+        conn.execute("DELETE FROM alertas_pendientes WHERE id=?", (id_alerta,))
+        _insertar_alerta_atendida(conn, alerta)
+        cambios_op = None
+        color = _color_alertas_pendientes(conn, alerta.get("numero_op"))
+        fila_op = conn.execute(
+            "SELECT json_extract(datos, '$.color_alerta') FROM ordenes_produccion WHERE numero_op=?",
+            (alerta.get("numero_op"),),
+        ).fetchone()
+        if fila_op is not None and fila_op[0] != color:
+            cambios_op = {"color_alerta": color}
+            _actualizar_op(conn, alerta["numero_op"], cambios_op)
+    return alerta, cambios_op
+
+def _color_alertas_pendientes(conn, numero_op):
+    # El más grave entre las alertas que siguen pendientes para la OP
+    colores = {f[0] for f in conn.execute(
+        "SELECT json_extract(datos, '$.color') FROM alertas_pendientes WHERE numero_op=?", (numero_op,)
+    )}
+    for color in ("red", "orange"):
+        if color in colores:
+            return color
+    return None
+
+# ------------------ Evidencias (conteo de referencias) ------------------ #
+def registrar_evidencia(nombre, tamano):
+    with transaccion() as conn:
+        conn.execute(
+            "INSERT INTO evidencias (nombre, tamano, fecha_alta) VALUES (?, ?, datetime('now')) "
+            "ON CONFLICT (nombre) DO UPDATE SET tamano = excluded.tamano",
+            (nombre, tamano),
+        )
+
+def _referenciar_evidencia(conn, nombre):
+    if nombre:
+        conn.execute(
+            "INSERT INTO evidencias (nombre, referencias, fecha_alta) VALUES (?, 1, datetime('now')) "
+            "ON CONFLICT (nombre) DO UPDATE SET referencias = referencias + 1",
+            (nombre,),
+        )
+
+def _contar_referencias(conn):
+    # Referencias reales: alertas (pendientes y atendidas) y eventos de la bitácora
+    conteo = {}
+    for tabla in ("alertas_pendientes", "alertas_atendidas"):
+        for (nombre,) in conn.execute(f"SELECT json_extract(datos, '$.foto_nombre') FROM {tabla}"):
+            if nombre:
+                conteo[nombre] = conteo.get(nombre, 0) + 1
+    for evento in bitacora.leer_eventos():
+        nombre = evento.get("foto_nombre")
+        if nombre:
+            conteo[nombre] = conteo.get(nombre, 0) + 1
+    return conteo
+
+def _reescribir_referencias(conn, conteo):
+    conn.execute("UPDATE evidencias SET referencias = 0")
+    conn.executemany(
+        "INSERT INTO evidencias (nombre, referencias, fecha_alta) VALUES (?, ?, datetime('now')) "
+        "ON CONFLICT (nombre) DO UPDATE SET referencias = excluded.referencias",
+        list(conteo.items()),
+    )
+
+def recontar_evidencias():
+    # Corrige los contadores (p. ej. alertas borradas) y devuelve nombre -> referencias
+    with transaccion() as conn:
+        conteo = _contar_referencias(conn)
+        _reescribir_referencias(conn, conteo)
+    return conteo
+
+def quitar_evidencias(nombres):
+    with transaccion() as conn:
+        conn.executemany("DELETE FROM evidencias WHERE nombre=? AND referencias=0", [(n,) for n in nombres])
+
+# ------------------ Migración desde data/*.json ------------------ #
+def _agregar_columnas(conn):
+    # Columnas agregadas después de crear la base (CREATE TABLE IF NOT EXISTS no las suma)
+    columnas = {fila["name"] for fila in conn.execute("PRAGMA table_info(ordenes_produccion)")}
+    if "version" not in columnas:
+        conn.execute("ALTER TABLE ordenes_produccion ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    columnas = {fila["name"] for fila in conn.execute("PRAGMA table_info(historial)")}
+    if "duracion_min" not in columnas:
+        conn.execute("ALTER TABLE historial ADD COLUMN duracion_min REAL")
+        # Entradas ya cerradas: se calcula una vez aquí y no en cada lectura
+        conn.execute(
+            "UPDATE historial SET duracion_min = round((julianday(fin) - julianday(inicio)) * 1440, 2) "
+            "WHERE fin IS NOT NULL AND inicio IS NOT NULL"
+        )
+
+def _leer_json(ruta, por_defecto):
+    if os.path.exists(ruta):
+        with open(ruta, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return por_defecto
+
+def _iniciar_migracion(conn, clave):
+    # True con BEGIN IMMEDIATE abierto si la migración `clave` falta. Se vuelve
+    # a mirar meta con el bloqueo tomado: otro proceso pudo migrar entre la
+    # primera lectura y el BEGIN.
+    consulta = "SELECT 1 FROM meta WHERE clave=?"
+    if conn.execute(consulta, (clave,)).fetchone():
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    if conn.execute(consulta, (clave,)).fetchone():
+        conn.execute("ROLLBACK")
+        return False
+    return True
+
+def migrar_desde_json(conn):
+    # Migración única: se registra en la tabla meta y no se repite
+    if not _iniciar_migracion(conn, "migracion_json"):
+        return False
+
+    try:
+        _reemplazar_etapas(conn, _leer_json(ETAPAS_JSON, []))
+        for op in _leer_json(OPS_JSON, []):
+            conn.execute("DELETE FROM ordenes_produccion WHERE numero_op=?", (op["numero_op"],))
+            conn.execute("DELETE FROM historial WHERE numero_op=?", (op["numero_op"],))
+            _insertar_op(conn, op)
+        for alerta in _leer_json(ALERTAS_PENDIENTES_JSON, []):
+            _insertar_alerta_pendiente(conn, alerta)
+        for alerta in _leer_json(ALERTAS_ATENDIDAS_JSON, []):
+            _insertar_alerta_atendida(conn, alerta)
+        conn.execute("INSERT INTO meta (clave, valor) VALUES ('migracion_json', datetime('now'))")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return True
+
+def migrar_rollups(conn):
+    # Cálculo de los agregados desde la bitácora existente (una vez por versión
+    # de rollups.METRICAS; v2 agregó cantidad_final, personas y tiempo_estadia_min)
+    if not _iniciar_migracion(conn, "rollups_v2"):
+        return False
+
+    try:
+        info_ops = {
+            fila["numero_op"]: (fila["cliente"], fila["producto"])
+            for fila in conn.execute("SELECT numero_op, cliente, producto FROM ordenes_produccion")
+        }
+        rollups.reconstruir(conn, bitacora.leer_eventos(), info_ops)
+        conn.execute("INSERT INTO meta (clave, valor) VALUES ('rollups_v2', datetime('now'))")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return True
+
+def migrar_evidencias(conn):
+    # Conteo inicial de referencias de las evidencias ya existentes (una sola vez)
+    if not _iniciar_migracion(conn, "evidencias_v1"):
+        return False
+
+    try:
+        _reescribir_referencias(conn, _contar_referencias(conn))
+        conn.execute("INSERT INTO meta (clave, valor) VALUES ('evidencias_v1', datetime('now'))")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return True
+
+if __name__ == "__main__":
+    # python almacenamiento.py -> crea la base y migra los JSON de data/ si aún no se hizo
+    inicializar()
+    with conexion() as conn:
+        for tabla in ("etapas", "ordenes_produccion", "historial", "alertas_pendientes", "alertas_atendidas", "evidencias"):
+            total = conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+            print(f"{tabla}: {total} filas")
@@ -4,10 +4,9 @@ import etapas
 import crear_op
 import kanban
 import historial
-import json
-import os
 import alertas
 import trazabilidad
+import datos
 
 st.set_page_config(
     page_title="OmLean - Sistema Kanban",
@@ -20,9 +19,6 @@ st.set_page_config(
 #st.markdown("<h4 style='text-align: center; color: gray;'>Optimiza tu producción con herramientas Lean Manufacturing</h4>", unsafe_allow_html=True)
 
 
-ALERTAS_FILE = "data/alertas_pendientes.json"
-OPS_FILE = "data/ordenes_produccion.json"
-
 def mostrar_usuario_rol_logout():
     # Contenedor con ancho limitado usando columnas
     col1, col2 = st.sidebar.columns([3,1])  # Col1 ancho mayor, col2 para botón pequeño
@@ -38,15 +34,33 @@ def mostrar_usuario_rol_logout():
             st.session_state.clear()
             st.rerun()
 
-def cargar_ops():
-    if os.path.exists(OPS_FILE):
-        with open(OPS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+def mostrar_estadisticas_cache():
+    stats = datos.estadisticas()
+    with st.sidebar.expander("⚡ Caché de datos"):
+        st.write(f"Aciertos: {stats['aciertos']} — Fallos: {stats['fallos']}")
+        st.write(f"Tasa de aciertos: {stats['tasa_aciertos']:.0%}")
+        st.write(f"Tiempo total de carga: {stats['segundos_carga']:.3f} s")
+
+
 
 
 
+def modulo_usuarios():
+    login.registrar_usuario()
+    login.administrar_usuarios()
 
+# Sección -> (roles con acceso, función que la dibuja, cargas de datos que usa)
+SECCIONES = {
+    "⚙️ Etapas": (["administrador", "planificador"], etapas.modulo_etapas, [datos.cargar_etapas]),
+    "➕ Crear OP": (["administrador", "planificador"], crear_op.crear_op, [datos.cargar_etapas, datos.cargar_indice_ops]),
+    "📊 Kanban": (["administrador", "planificador"], kanban.tablero_kanban, [datos.cargar_etapas, datos.cargar_indice_ops]),
+    "📁 Historial": (["administrador", "planificador"], historial.modulo_historial_ops, [datos.cargar_ops]),
+    "👥 Usuarios": (["administrador"], modulo_usuarios, []),
+    "🔍 Trazabilidad": (["administrador", "planificador"], trazabilidad.mostrar_trazabilidad, [trazabilidad.cargar_trazabilidad]),
+}
+
+# Precalienta en segundo plano la caché de la sección siguiente a la activa
+PRECARGAR_SIGUIENTE = True
 
 # Inicio sesión
 if 'login' not in st.session_state or not st.session_state['login']:
@@ -54,45 +68,22 @@ if 'login' not in st.session_state or not st.session_state['login']:
 else:
     mostrar_usuario_rol_logout()
     alertas.mostrar_notificaciones(st.session_state['usuario'])  # <- NUEVO
-
-    tabs = st.tabs(["⚙️ Etapas", "➕ Crear OP", "📊 Kanban", "📁 Historial", "👥 Usuarios","🔍 Trazabilidad"])
-
-    with tabs[0]:
-        if st.session_state['rol'] in ["administrador", "planificador"]:
-            etapas.modulo_etapas()
-        else:
-            st.warning("No tienes permiso para ver esta sección.")
-
-    with tabs[1]:
-        if st.session_state['rol'] in ["administrador", "planificador"]:
-            crear_op.crear_op()
-            # Por ejemplo, después de crear OP, agregar notificación:
-            # st.session_state.setdefault('notificaciones', []).append("Se creó una nueva OP")
-        else:
-            st.warning("No tienes permiso para ver esta sección.")
-
-    with tabs[2]:
-        if st.session_state['rol'] in ["administrador", "planificador"]:
-            kanban.tablero_kanban()
-        else:
-            st.warning("No tienes permiso para ver esta sección.")
-        
-
-    with tabs[3]:
-        if st.session_state['rol'] in ["administrador", "planificador"]:
-            historial.modulo_historial_ops()
-        else:
-            st.warning("No tienes permiso para ver esta sección.")
-
-    with tabs[4]:
-        if st.session_state['rol'] == "administrador":
-            login.registrar_usuario()
-            login.administrar_usuarios()
-        else:
-            st.warning("No tienes permiso para ver esta sección.")
-
-    with tabs[5]:
-        if st.session_state['rol'] in ["administrador", "planificador"]:
-            trazabilidad.mostrar_trazabilidad()
-        else:
-            st.warning("No tienes permiso para ver esta sección.")
+    if st.session_state['rol'] == "administrador":
+        mostrar_estadisticas_cache()
+
+    # Solo se ejecuta la sección activa (st.tabs ejecutaría las seis en cada rerun)
+    seccion = st.radio("Sección", list(SECCIONES), horizontal=True, label_visibility="collapsed", key="seccion_activa")
+    roles, modulo, _ = SECCIONES[seccion]
+
+    # Se lanza antes de dibujar: la sección puede cortar el script con st.rerun()
+    if PRECARGAR_SIGUIENTE:
+        nombres = list(SECCIONES)
+        siguiente = nombres[(nombres.index(seccion) + 1) % len(nombres)]
+        roles_siguiente, _, cargas = SECCIONES[siguiente]
+        if st.session_state['rol'] in roles_siguiente:
+            datos.precargar(*cargas)
+
+    if st.session_state['rol'] in roles:
+        modulo()
+    else:
+        st.warning("No tienes permiso para ver esta sección.")
@@ -0,0 +1,71 @@
+# ------------------ Escritura segura de archivos ------------------ #
+# Utilidades para los archivos que no viven en SQLite (bitácora, snapshots
+# Parquet, PDF e imágenes):
+#   - escribir_atomico: se escribe a un temporal en la misma carpeta y se
+#     reemplaza con os.replace; un lector nunca ve un archivo a medias.
+#   - bloqueo: bloqueo exclusivo entre hilos del proceso y, con un archivo
+#     .lock (fcntl en Linux, msvcrt en Windows), entre procesos.
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_lock = threading.Lock()
+_locks_hilos = {}  # ruta del .lock -> threading.Lock
+
+def _bloquear(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            time.sleep(0.05)  # LK_LOCK se rinde tras ~10 s: se sigue esperando
+
+def _desbloquear(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def bloqueo(ruta):
+    ruta_lock = ruta + ".lock"
+    with _lock:
+        lock_hilo = _locks_hilos.setdefault(ruta_lock, threading.Lock())
+    with lock_hilo:
+        os.makedirs(os.path.dirname(ruta_lock) or ".", exist_ok=True)
+        with open(ruta_lock, "a+b") as f:
+            _bloquear(f)
+            try:
+                yield
+            finally:
+                _desbloquear(f)
+
+@contextmanager
+def escribir_atomico(ruta):
+    # with escribir_atomico(ruta) as f: f.write(...)  (modo binario)
+    directorio = os.path.dirname(ruta) or "."
+    os.makedirs(directorio, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, prefix=os.path.basename(ruta) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
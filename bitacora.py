@@ -0,0 +1,129 @@
+# ------------------ Bitácora de trazabilidad (JSON Lines) ------------------ #
+# Los eventos de trazabilidad son inmutables: se agregan al final de un archivo
+# .jsonl (una línea por evento) con fsync, en lugar de reescribir todo el
+# historial. Los segmentos rotan al superar SEGMENTO_MAX_BYTES.
+# Las escrituras toman un bloqueo de archivo: otro proceso (otra instancia de
+# la app o un script) puede agregar eventos o rotar el segmento a la vez.
+import json
+import os
+import threading
+import archivos
+
+BITACORA_DIR = os.path.join("data", "trazabilidad")
+TRAZABILIDAD_JSON = os.path.join("data", "trazabilidad.json")
+PREFIJO_SEGMENTO = "trazabilidad-"
+SEGMENTO_MAX_BYTES = 8 * 1024 * 1024
+RUTA_BLOQUEO = os.path.join(BITACORA_DIR, "escritura")
+
+_lock = threading.Lock()
+_segmento_actual = None  # [ruta, tamaño] del segmento abierto para escritura
+
+def _nombre_segmento(numero):
+    return f"{PREFIJO_SEGMENTO}{numero:06d}.jsonl"
+
+def _numero_segmento(nombre):
+    return int(nombre[len(PREFIJO_SEGMENTO):-len(".jsonl")])
+
+def listar_segmentos():
+    if not os.path.isdir(BITACORA_DIR):
+        return []
+    nombres = [n for n in os.listdir(BITACORA_DIR) if n.startswith(PREFIJO_SEGMENTO) and n.endswith(".jsonl")]
+    nombres.sort(key=_numero_segmento)
+    return [os.path.join(BITACORA_DIR, n) for n in nombres]
+
+def _linea(evento):
+    return (json.dumps(evento, ensure_ascii=False) + "\n").encode("utf-8")
+
+def _escribir(ruta, datos):
+    # Devuelve el tamaño real del archivo (incluye lo escrito por otros procesos)
+    with open(ruta, "ab") as f:
+        f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+def _abrir_segmento():
+    # Se llama una vez por proceso (con _lock tomado) para ubicar el segmento activo
+    global _segmento_actual
+    os.makedirs(BITACORA_DIR, exist_ok=True)
+    segmentos = listar_segmentos()
+    if not segmentos:
+        _migrar_desde_json()
+        segmentos = listar_segmentos()
+    if not segmentos:
+        ruta = os.path.join(BITACORA_DIR, _nombre_segmento(1))
+        open(ruta, "ab").close()
+        segmentos = [ruta]
+
+    ruta = segmentos[-1]
+    tamano = os.path.getsize(ruta)
+    if tamano:
+        # Si el proceso anterior murió a mitad de una línea, se cierra con un
+        # salto para que el siguiente evento no quede pegado a la línea rota.
+        with open(ruta, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                _escribir(ruta, b"\n")
+                tamano += 1
+    _segmento_actual = [ruta, tamano]
+
+def _seguir_rotacion():
+    # Si otro proceso ya rotó, se continúa en el segmento más nuevo
+    while True:
+        numero = _numero_segmento(os.path.basename(_segmento_actual[0])) + 1
+        siguiente = os.path.join(BITACORA_DIR, _nombre_segmento(numero))
+        if not os.path.exists(siguiente):
+            return
+        _segmento_actual[0] = siguiente
+        _segmento_actual[1] = os.path.getsize(siguiente)
+
+def _rotar():
+    ruta_actual = _segmento_actual[0]
+    numero = _numero_segmento(os.path.basename(ruta_actual)) + 1
+    _segmento_actual[0] = os.path.join(BITACORA_DIR, _nombre_segmento(numero))
+    _segmento_actual[1] = 0
+
+def registrar_evento(evento):
+    # O(1): una línea al final del segmento activo
+    datos = _linea(evento)
+    with _lock:
+        if _segmento_actual is None:
+            _abrir_segmento()
+        with archivos.bloqueo(RUTA_BLOQUEO):
+            _seguir_rotacion()
+            if _segmento_actual[1] >= SEGMENTO_MAX_BYTES:
+                _rotar()
+            _segmento_actual[1] = _escribir(_segmento_actual[0], datos)
+
+def registrar_eventos(eventos):
+    for evento in eventos:
+        registrar_evento(evento)
+
+def leer_segmento(ruta):
+    with open(ruta, "rb") as f:
+        for linea in f:
+            if not linea.strip():
+                continue
+            try:
+                yield json.loads(linea)
+            except ValueError:
+                # Línea incompleta por un corte durante la escritura: se omite
+                continue
+
+def leer_eventos():
+    if _segmento_actual is None:
+        with _lock:
+            if _segmento_actual is None:
+                _abrir_segmento()
+    for ruta in listar_segmentos():
+        yield from leer_segmento(ruta)
+
+def _migrar_desde_json():
+    # Migración única desde el arreglo data/trazabilidad.json original
+    if not os.path.exists(TRAZABILIDAD_JSON):
+        return
+    with open(TRAZABILIDAD_JSON, "r", encoding="utf-8") as f:
+        eventos = json.load(f)
+    with archivos.escribir_atomico(os.path.join(BITACORA_DIR, _nombre_segmento(1))) as f:
+        for evento in eventos:
+            f.write(_linea(evento))
@@ -0,0 +1,98 @@
+# ------------------ Conversión de PDF a imágenes en segundo plano ------------------ #
+# El PDF subido al crear la OP se guarda en disco y se convierte en un pool de
+# procesos: la sesión del planificador no espera al render. Se generan todas
+# las páginas en dos resoluciones (vista previa y completa) y, al terminar, se
+# adjuntan a la OP. Mientras tanto la OP queda con imagen_estado="procesando".
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF para convertir PDF a imagen
+import archivos
+import datos
+import medios
+
+PDF_DIR = os.path.join("files", "pdf_op")
+IMAGENES_DIR = os.path.join("files", "imagenes_op")
+DPI_PREVIEW = 50
+DPI_COMPLETO = 150
+MAX_PROCESOS = 2
+
+_pool = None
+_lock = threading.Lock()
+_en_proceso = set()  # números de OP con una conversión en curso en este proceso
+_pendientes_revisados = False
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MAX_PROCESOS)
+        return _pool
+
+def renderizar_pdf(ruta_pdf, base_nombre):
+    # Se ejecuta en un proceso del pool: devuelve las rutas generadas por página
+    paginas = []
+    with fitz.open(ruta_pdf) as doc:
+        for numero, page in enumerate(doc, start=1):
+            ruta_preview = os.path.join(IMAGENES_DIR, f"{base_nombre}_p{numero}_preview.png")
+            ruta_completa = os.path.join(IMAGENES_DIR, f"{base_nombre}_p{numero}.png")
+            for ruta, dpi in ((ruta_preview, DPI_PREVIEW), (ruta_completa, DPI_COMPLETO)):
+                with archivos.escribir_atomico(ruta) as f:
+                    f.write(page.get_pixmap(dpi=dpi).tobytes("png"))
+            paginas.append({"pagina": numero, "preview": ruta_preview, "completa": ruta_completa})
+    return paginas
+
+def guardar_pdf(pdf_file, base_nombre):
+    # Copia el archivo subido a disco por bloques
+    ruta = os.path.join(PDF_DIR, f"{base_nombre}.pdf")
+    pdf_file.seek(0)
+    with archivos.escribir_atomico(ruta) as f:
+        while True:
+            bloque = pdf_file.read(1024 * 1024)
+            if not bloque:
+                break
+            f.write(bloque)
+    return ruta
+
+def _al_terminar(numero_op, futuro):
+    # Corre en un hilo del proceso de Streamlit cuando el worker termina
+    try:
+        paginas = futuro.result()
+    except Exception as e:
+        cambios = {"imagen_estado": "error", "imagen_error": str(e)}
+    else:
+        for pagina in paginas:
+            medios.registrar(pagina["preview"])
+            medios.registrar(pagina["completa"])
+        cambios = {
+            "imagen_estado": "listo",
+            "paginas_op": paginas,
+            "imagen_op": paginas[0]["completa"] if paginas else None,
+        }
+    try:
+        datos.actualizar_op(numero_op, cambios)
+    finally:
+        with _lock:
+            _en_proceso.discard(numero_op)
+
+def encolar_conversion(numero_op, ruta_pdf, base_nombre):
+    with _lock:
+        if numero_op in _en_proceso:
+            return
+        _en_proceso.add(numero_op)
+    os.makedirs(IMAGENES_DIR, exist_ok=True)
+    futuro = _get_pool().submit(renderizar_pdf, ruta_pdf, base_nombre)
+    futuro.add_done_callback(lambda f: _al_terminar(numero_op, f))
+
+def reanudar_pendientes():
+    # Tras un reinicio del servidor, vuelve a encolar las OPs que quedaron
+    # "procesando" (una vez por proceso).
+    global _pendientes_revisados
+    with _lock:
+        if _pendientes_revisados:
+            return
+        _pendientes_revisados = True
+    for op in datos.cargar_ops():
+        if op.get("imagen_estado") == "procesando" and op.get("pdf_op"):
+            base_nombre = os.path.splitext(os.path.basename(op["pdf_op"]))[0]
+            encolar_conversion(op["numero_op"], op["pdf_op"], base_nombre)
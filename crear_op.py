@@ -1,46 +1,13 @@
 import streamlit as st
-import json
-import os
+import sqlite3
 from datetime import datetime, date
-from PIL import Image
-import fitz  # PyMuPDF para convertir PDF a imagen
-
-ETAPAS_FILE = "data/etapas.json"
-OPS_FILE = "data/ordenes_produccion.json"
-IMAGENES_DIR = "files/imagenes_op"
-
-os.makedirs(IMAGENES_DIR, exist_ok=True)
-
-def cargar_etapas():
-    if os.path.exists(ETAPAS_FILE):
-        with open(ETAPAS_FILE, "r") as f:
-            return json.load(f)
-    return []
-
-def cargar_ops():
-    if os.path.exists(OPS_FILE):
-        with open(OPS_FILE, "r") as f:
-            return json.load(f)
-    return []
-
-def guardar_ops(ops):
-    with open(OPS_FILE, "w") as f:
-        json.dump(ops, f, indent=4)
-
-def guardar_pdf_como_imagen(pdf_file, nombre_archivo_imagen):
-    try:
-        doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-        page = doc.load_page(0)  # primera página
-        pix = page.get_pixmap(dpi=150)
-        ruta_imagen = os.path.join(IMAGENES_DIR, nombre_archivo_imagen)
-        pix.save(ruta_imagen)
-        return ruta_imagen
-    except Exception as e:
-        st.error(f"Error al convertir PDF con fitz: {e}")
-    return None
+import datos
+import conversion_pdf
+from datos import cargar_etapas
 
 def crear_op():
     st.subheader("🆕 Crear Orden de Producción (OP)")
+    conversion_pdf.reanudar_pendientes()
 
     etapas_disponibles = cargar_etapas()
     nombres_etapas_disponibles = [e["nombre"] for e in etapas_disponibles]
@@ -86,16 +53,15 @@ def crear_op():
                 st.warning("Por favor, completa todos los campos.")
                 return
 
-            ops = cargar_ops()
-            if any(op["numero_op"] == numero_op for op in ops):
+            if datos.existe_op(numero_op):
                 st.error("Ya existe una OP con ese número.")
                 return
 
-            imagen_path = None
+            # El PDF solo se guarda aquí; la conversión a imágenes corre en segundo plano
+            ruta_pdf = None
             if archivo_pdf:
-                nombre_archivo = f"{numero_op}_{producto.replace(' ', '_')}.png"
-                imagen_path = guardar_pdf_como_imagen(archivo_pdf, nombre_archivo)
-                st.write(f"Imagen guardada en: {imagen_path}")
+                base_nombre = f"{numero_op}_{producto.replace(' ', '_')}"
+                ruta_pdf = conversion_pdf.guardar_pdf(archivo_pdf, base_nombre)
 
             now = datetime.now().isoformat()
             nueva_op = {
@@ -116,11 +82,20 @@ def crear_op():
                         "observacion": None
                     }
                 ],
-                "imagen_op": imagen_path
+                "imagen_op": None,
+                "pdf_op": ruta_pdf,
+                "imagen_estado": "procesando" if ruta_pdf else None
             }
 
-            ops.append(nueva_op)
-            guardar_ops(ops)
+            try:
+                datos.insertar_op(nueva_op)
+            except sqlite3.IntegrityError:
+                # Otra sesión creó la misma OP entre la validación y el guardado
+                st.error("Ya existe una OP con ese número.")
+                return
+            if ruta_pdf:
+                conversion_pdf.encolar_conversion(numero_op, ruta_pdf, base_nombre)
+                st.info("📄 El PDF se está convirtiendo a imágenes; aparecerán en la OP al terminar.")
             st.success(f"✅ OP {numero_op} creada correctamente.")
 
 # Para usar la función en una app principal de Streamlit, basta con llamar:
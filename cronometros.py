@@ -0,0 +1,87 @@
+# ------------------ Cronómetros de etapa persistentes ------------------ #
+# Un cronómetro por OP y etapa guardado en SQLite: sobrevive a reruns,
+# reconexiones de la tablet y reinicios del servidor. Se guarda el tiempo
+# acumulado de los tramos cerrados y el inicio del tramo en curso; el tiempo
+# transcurrido se calcula al leer.
+#
+# Estados: "corriendo" -> "pausado" -> "corriendo" ... -> "detenido".
+# Las funciones reciben una conexión abierta: almacenamiento.py las llama
+# dentro de sus transacciones.
+from datetime import datetime
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cronometros (
+    numero_op TEXT NOT NULL,
+    etapa TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    acumulado_seg REAL NOT NULL DEFAULT 0,
+    inicio_tramo TEXT,
+    usuario TEXT,
+    actualizado TEXT,
+    PRIMARY KEY (numero_op, etapa)
+);
+"""
+
+def _ahora():
+    return datetime.now().isoformat()
+
+def _segundos_tramo(inicio_tramo, hasta):
+    if not inicio_tramo:
+        return 0.0
+    return max((datetime.fromisoformat(hasta) - datetime.fromisoformat(inicio_tramo)).total_seconds(), 0.0)
+
+def leer(conn, numero_op, etapa, ahora=None):
+    # dict con estado y segundos transcurridos hasta ahora, o None si no hay cronómetro
+    fila = conn.execute(
+        "SELECT estado, acumulado_seg, inicio_tramo, usuario FROM cronometros WHERE numero_op=? AND etapa=?",
+        (numero_op, etapa),
+    ).fetchone()
+    if fila is None:
+        return None
+    estado, acumulado, inicio_tramo, usuario = fila
+    return {
+        "estado": estado,
+        "segundos": acumulado + _segundos_tramo(inicio_tramo, ahora or _ahora()),
+        "inicio_tramo": inicio_tramo,
+        "usuario": usuario,
+    }
+
+def iniciar(conn, numero_op, etapa, usuario):
+    # Arranca (o reanuda si estaba pausado). Un cronómetro detenido vuelve a cero.
+    ahora = _ahora()
+    conn.execute(
+        "INSERT INTO cronometros (numero_op, etapa, estado, acumulado_seg, inicio_tramo, usuario, actualizado) "
+        "VALUES (?, ?, 'corriendo', 0, ?, ?, ?) "
+        "ON CONFLICT (numero_op, etapa) DO UPDATE SET "
+        "acumulado_seg = CASE WHEN estado = 'detenido' THEN 0 ELSE acumulado_seg END, "
+        "inicio_tramo = CASE WHEN estado = 'corriendo' THEN inicio_tramo ELSE excluded.inicio_tramo END, "
+        "estado = 'corriendo', usuario = excluded.usuario, actualizado = excluded.actualizado",
+        (numero_op, etapa, ahora, usuario, ahora),
+    )
+
+def _cerrar_tramo(conn, numero_op, etapa, nuevo_estado):
+    ahora = _ahora()
+    cronometro = leer(conn, numero_op, etapa, ahora)
+    if cronometro is None or cronometro["estado"] == "detenido":
+        return cronometro
+    conn.execute(
+        "UPDATE cronometros SET estado=?, acumulado_seg=?, inicio_tramo=NULL, actualizado=? WHERE numero_op=? AND etapa=?",
+        (nuevo_estado, cronometro["segundos"], ahora, numero_op, etapa),
+    )
+    cronometro["estado"] = nuevo_estado
+    cronometro["inicio_tramo"] = None
+    return cronometro
+
+def pausar(conn, numero_op, etapa):
+    return _cerrar_tramo(conn, numero_op, etapa, "pausado")
+
+def detener(conn, numero_op, etapa):
+    return _cerrar_tramo(conn, numero_op, etapa, "detenido")
+
+def finalizar(conn, numero_op, etapa):
+    # Al dejar la etapa: detiene, borra el cronómetro y devuelve los minutos medidos
+    cronometro = detener(conn, numero_op, etapa)
+    if cronometro is None:
+        return None
+    conn.execute("DELETE FROM cronometros WHERE numero_op=? AND etapa=?", (numero_op, etapa))
+    return round(cronometro["segundos"] / 60, 2)
@@ -0,0 +1,339 @@
+# ------------------ Acceso a datos con caché compartida ------------------ #
+# Punto único de lectura/escritura para los módulos de la app. Las lecturas se
+# guardan en una caché de proceso (compartida por todas las sesiones de
+# Streamlit) cuya clave es la ruta + mtime + tamaño de los archivos de origen:
+# mientras no cambien en disco, cada rerun reutiliza el resultado ya parseado.
+# Las escrituras hechas a través de este módulo invalidan la caché afectada.
+#
+# Los objetos devueltos se comparten entre sesiones: no deben modificarse en
+# el lugar. Para cambiar datos se usan las funciones de escritura de abajo.
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import almacenamiento
+import almacen_evidencias
+import notificador
+import planificador
+import semaforo
+import vsm
+from almacenamiento import ConflictoVersion
+from indice_alertas import IndiceAlertas
+from indice_ops import IndiceOPs
+
+_cache = {}  # nombre -> (firma, valor), en orden de uso (el primero es el menos reciente)
+MAX_ENTRADAS = 256
+_lock = threading.Lock()
+_estadisticas = {"aciertos": 0, "fallos": 0, "segundos_carga": 0.0}
+_precarga = ThreadPoolExecutor(max_workers=1, thread_name_prefix="precarga")
+_precargas_pendientes = set()
+_replanificacion = ThreadPoolExecutor(max_workers=1, thread_name_prefix="planificacion")
+_estado_plan = {"en_cola": False, "ultimo": 0.0}
+PLAN_VIGENCIA_S = 15 * 60  # sin cambios, el plan se rehace igual cada tanto (avanza el reloj)
+
+# ------------------ Caché ------------------ #
+def _firma(rutas):
+    firma = []
+    for ruta in rutas:
+        try:
+            info = os.stat(ruta)
+            firma.append((ruta, info.st_mtime_ns, info.st_size))
+        except FileNotFoundError:
+            firma.append((ruta, None, None))
+    return tuple(firma)
+
+def cargar_con_cache(nombre, rutas, cargador):
+    # rutas: función que devuelve los archivos de los que depende el valor.
+    # La firma se toma antes de cargar: si alguien escribe mientras tanto, la
+    # siguiente lectura verá una firma distinta y volverá a cargar.
+    firma = _firma(rutas())
+    with _lock:
+        entrada = _cache.get(nombre)
+        if entrada is not None and entrada[0] == firma:
+            _estadisticas["aciertos"] += 1
+            _cache[nombre] = _cache.pop(nombre)
+            return entrada[1]
+
+    inicio = time.perf_counter()
+    valor = cargador()
+    duracion = time.perf_counter() - inicio
+
+    with _lock:
+        _estadisticas["fallos"] += 1
+        _estadisticas["segundos_carga"] += duracion
+        _cache.pop(nombre, None)
+        _cache[nombre] = (firma, valor)
+        # Páginas de historial, rangos de KPIs...: se descarta lo menos usado
+        while len(_cache) > MAX_ENTRADAS:
+            del _cache[next(iter(_cache))]
+    return valor
+
+def invalidar(*nombres):
+    # Invalida también las entradas derivadas ("trazabilidad:tabla:...", "rollups:...")
+    with _lock:
+        if not nombres:
+            _cache.clear()
+            return
+        for clave in list(_cache):
+            if any(clave == n or clave.startswith(n + ":") for n in nombres):
+                del _cache[clave]
+
+def _registrar_escritura(firma_previa, mutaciones, publicar=True):
+    # Actualiza la caché tras una escritura propia en la base. mutaciones:
+    # nombre -> función que aplica el cambio al valor en caché (o None para
+    # descartarlo). Las entradas cargadas con la firma previa a la escritura
+    # siguen vigentes y pasan a la firma nueva; si la firma ya no coincidía,
+    # alguien más escribió y la próxima lectura recarga desde disco.
+    firma_nueva = _firma(_rutas_db())
+    with _lock:
+        for clave, (firma, valor) in list(_cache.items()):
+            base = clave.split(":")[0]
+            mutacion = mutaciones.get(base)
+            if base in mutaciones and (mutacion is None or clave != base or firma != firma_previa):
+                del _cache[clave]
+            elif firma == firma_previa:
+                if mutacion is not None:
+                    mutacion(valor)
+                _cache[clave] = (firma_nueva, valor)
+    # Avisa a las demás sesiones qué datos cambiaron
+    if publicar:
+        notificador.publicar(*mutaciones)
+
+def precargar(*cargadores):
+    # Ejecuta las cargas en un hilo de fondo para que la caché esté lista
+    # cuando el usuario abra la sección; no repite una carga ya en cola.
+    for cargador in cargadores:
+        with _lock:
+            if cargador in _precargas_pendientes:
+                continue
+            _precargas_pendientes.add(cargador)
+        _precarga.submit(_ejecutar_precarga, cargador)
+
+def _ejecutar_precarga(cargador):
+    try:
+        cargador()
+    except Exception:
+        pass  # la sección volverá a cargar (y mostrar el error) al abrirse
+    finally:
+        with _lock:
+            _precargas_pendientes.discard(cargador)
+
+def programar_replanificacion():
+    # Replanifica en segundo plano. Los pedidos que llegan mientras hay uno en
+    # cola se funden en él; uno que llega durante la ejecución encola otro.
+    with _lock:
+        if _estado_plan["en_cola"]:
+            return
+        _estado_plan["en_cola"] = True
+    _replanificacion.submit(_ejecutar_replanificacion)
+
+def _ejecutar_replanificacion():
+    with _lock:
+        _estado_plan["en_cola"] = False
+    try:
+        replanificar()
+    except Exception:
+        pass  # se reintenta con el próximo cambio o al vencer el plan
+
+def planificacion_vigente():
+    # Programa una replanificación si el último plan es más viejo que PLAN_VIGENCIA_S
+    if time.monotonic() - _estado_plan["ultimo"] > PLAN_VIGENCIA_S:
+        programar_replanificacion()
+
+def estadisticas():
+    with _lock:
+        resultado = dict(_estadisticas)
+    total = resultado["aciertos"] + resultado["fallos"]
+    resultado["tasa_aciertos"] = resultado["aciertos"] / total if total else 0.0
+    return resultado
+
+def _rutas_db():
+    almacenamiento.inicializar()
+    return [almacenamiento.DB_FILE, almacenamiento.DB_FILE + "-wal"]
+
+# ------------------ Lecturas ------------------ #
+def cargar_etapas():
+    return cargar_con_cache("etapas", _rutas_db, almacenamiento.cargar_etapas)
+
+def cargar_indice_ops():
+    return cargar_con_cache("ops", _rutas_db, lambda: IndiceOPs(almacenamiento.cargar_ops()))
+
+def cargar_ops():
+    return cargar_indice_ops().todas()
+
+def cargar_alertas_pendientes():
+    return cargar_con_cache("alertas_pendientes", _rutas_db, almacenamiento.cargar_alertas_pendientes)
+
+def cargar_vsm(desde=None, hasta=None):
+    # Se recalcula (etapas × métricas) solo cuando cambian los agregados o las etapas
+    return cargar_con_cache(
+        f"vsm:{desde}:{hasta}",
+        _rutas_db,
+        lambda: vsm.calcular(
+            cargar_etapas(),
+            {m: cargar_rollups("etapa", m, desde, hasta) for m in vsm.METRICAS},
+        ),
+    )
+
+def cargar_semaforo():
+    # numero_op -> color automático de atraso. Derivada de "ops": se recalcula
+    # solo cuando cambian las OPs o las etapas, o al pasar semaforo.PASO_MIN
+    # (la estadía en la etapa avanza con el reloj).
+    paso = int(time.time() // (semaforo.PASO_MIN * 60))
+    return cargar_con_cache(
+        f"ops:semaforo:{paso}", _rutas_db, lambda: semaforo.evaluar(cargar_ops(), cargar_etapas())
+    )
+
+def cargar_indice_alertas():
+    return cargar_con_cache(
+        "alertas_pendientes:indice", _rutas_db, lambda: IndiceAlertas(cargar_alertas_pendientes())
+    )
+
+def cargar_evidencias_ops(numeros_op):
+    # Derivada de las alertas: se descarta cuando se agrega o atiende una
+    numeros_op = sorted(set(numeros_op))
+    return cargar_con_cache(
+        f"alertas_pendientes:evidencias:{numeros_op}", _rutas_db, lambda: almacenamiento.evidencias_de_ops(numeros_op)
+    )
+
+def cargar_rollups(dimension, metrica, desde=None, hasta=None):
+    return cargar_con_cache(
+        f"rollups:{dimension}:{metrica}:{desde}:{hasta}",
+        _rutas_db,
+        lambda: almacenamiento.consultar_rollups(dimension, metrica, desde, hasta)
+    )
+
+def consultar_historial(filtros, orden="creacion", descendente=False, limite=50, desplazamiento=0):
+    # Una página de historial; se cachea por combinación de filtros y página
+    clave = f"ops:historial:{sorted(filtros.items())}:{orden}:{descendente}:{limite}:{desplazamiento}"
+    return cargar_con_cache(
+        clave,
+        _rutas_db,
+        lambda: almacenamiento.consultar_historial(filtros, orden, descendente, limite, desplazamiento)
+    )
+
+# ------------------ Escrituras (actualizan la caché) ------------------ #
+def guardar_etapas(etapas):
+    firma = _firma(_rutas_db())
+    almacenamiento.guardar_etapas(etapas)
+    _registrar_escritura(firma, {"etapas": None, "vsm": None})
+    invalidar("ops:semaforo")
+    programar_replanificacion()
+
+def _actualizar_en_indice(numero_op, cambios):
+    # Refleja en el índice en caché un UPDATE de la OP (que sube su versión en 1)
+    def mutacion(indice):
+        op = indice.obtener(numero_op)
+        if op is not None:
+            indice.actualizar(numero_op, dict(cambios, version=op.get("version", 1) + 1))
+    return mutacion
+
+def insertar_op(op):
+    firma = _firma(_rutas_db())
+    almacenamiento.insertar_op(op)
+    _registrar_escritura(firma, {"ops": lambda indice: indice.agregar(dict(op, version=1))})
+    programar_replanificacion()
+
+def existe_op(numero_op):
+    return numero_op in cargar_indice_ops()
+
+def actualizar_op(numero_op, cambios, version=None):
+    firma = _firma(_rutas_db())
+    resultado = almacenamiento.actualizar_op(numero_op, cambios, version)
+    _registrar_escritura(firma, {"ops": _actualizar_en_indice(numero_op, cambios)})
+    return resultado
+
+def avanzar_etapa(numero_op, cambios, evento, version=None):
+    # Lanza almacenamiento.ConflictoVersion si la OP ya no está en esa versión
+    firma = _firma(_rutas_db())
+    resultado = almacenamiento.avanzar_etapa(numero_op, cambios, evento, version)
+    _registrar_escritura(firma, {
+        "ops": lambda indice: resultado and indice.actualizar(numero_op, dict(cambios, **resultado)),
+        "trazabilidad": None,
+        "rollups": None,
+        "vsm": None,
+    })
+    if resultado:
+        programar_replanificacion()
+    return resultado
+
+def dividir_op(numero_op, nuevas_ops, eventos, version=None):
+    def mutacion(indice):
+        indice.quitar(numero_op)
+        for op in nuevas_ops:
+            indice.agregar(dict(op, version=1))
+
+    firma = _firma(_rutas_db())
+    almacenamiento.dividir_op(numero_op, nuevas_ops, eventos, version)
+    _registrar_escritura(firma, {"ops": mutacion, "trazabilidad": None, "rollups": None, "vsm": None})
+    programar_replanificacion()
+
+def leer_cronometro(numero_op, etapa):
+    # Sin caché: el tiempo transcurrido cambia a cada segundo
+    return almacenamiento.leer_cronometro(numero_op, etapa)
+
+def iniciar_cronometro(numero_op, etapa, usuario):
+    firma = _firma(_rutas_db())
+    almacenamiento.iniciar_cronometro(numero_op, etapa, usuario)
+    _registrar_escritura(firma, {})
+
+def pausar_cronometro(numero_op, etapa):
+    firma = _firma(_rutas_db())
+    almacenamiento.pausar_cronometro(numero_op, etapa)
+    _registrar_escritura(firma, {})
+
+def detener_cronometro(numero_op, etapa):
+    firma = _firma(_rutas_db())
+    almacenamiento.detener_cronometro(numero_op, etapa)
+    _registrar_escritura(firma, {})
+
+def replanificar():
+    # Plan a capacidad finita de todas las OPs abiertas; escribe solo las que
+    # cambiaron. Devuelve cuántas OPs se actualizaron.
+    _estado_plan["ultimo"] = time.monotonic()
+    planes = planificador.cambios(cargar_ops(), cargar_etapas())
+    if not planes:
+        return 0
+
+    def mutacion(indice):
+        for numero_op, plan in planes.items():
+            indice.actualizar(numero_op, plan)
+
+    firma = _firma(_rutas_db())
+    almacenamiento.guardar_planificacion(planes)
+    # Solo campos derivados del plan: no se avisa a las demás sesiones, que
+    # los toman en su próximo redibujo
+    _registrar_escritura(firma, {"ops": mutacion}, publicar=False)
+    return len(planes)
+
+def guardar_trazabilidad(evento):
+    firma = _firma(_rutas_db())
+    almacenamiento.registrar_evento(evento)
+    _registrar_escritura(firma, {"trazabilidad": None, "rollups": None, "vsm": None})
+
+def agregar_alerta_pendiente(alerta, cambios_op=None, evento=None):
+    mutaciones = {"alertas_pendientes": None, "trazabilidad": None}
+    if cambios_op:
+        mutaciones["ops"] = _actualizar_en_indice(alerta["numero_op"], cambios_op)
+
+    firma = _firma(_rutas_db())
+    resultado = almacenamiento.agregar_alerta_pendiente(alerta, cambios_op, evento)
+    _registrar_escritura(firma, mutaciones)
+    return resultado
+
+def guardar_evidencia(archivo):
+    # La fila de la evidencia no afecta a ninguna lectura en caché
+    firma = _firma(_rutas_db())
+    nombre = almacen_evidencias.guardar(archivo)
+    _registrar_escritura(firma, {})
+    return nombre
+
+def atender_alerta(id_alerta, cambios):
+    # Si era la última alerta de la OP, también limpia su color_alerta
+    firma = _firma(_rutas_db())
+    alerta, cambios_op = almacenamiento.atender_alerta(id_alerta, cambios)
+    mutaciones = {"alertas_pendientes": None}
+    if cambios_op:
+        mutaciones["ops"] = _actualizar_en_indice(alerta["numero_op"], cambios_op)
+    _registrar_escritura(firma, mutaciones)
+    return alerta
@@ -1,21 +1,7 @@
 import streamlit as st
-import json
-import os
 import pandas as pd
-
-# Guardar en carpeta 'data'
-RUTA_ETAPAS = os.path.join("data", "etapas.json")
-
-def cargar_etapas():
-    if os.path.exists(RUTA_ETAPAS):
-        with open(RUTA_ETAPAS, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
-
-def guardar_etapas(etapas):
-    os.makedirs("data", exist_ok=True)  # Asegura que la carpeta exista
-    with open(RUTA_ETAPAS, "w", encoding="utf-8") as f:
-        json.dump(etapas, f, indent=4, ensure_ascii=False)
+from datos import cargar_etapas, guardar_etapas
+from numeros import numero
 
 def nombre_unico(etapas, nombre, idx_editar=None):
     for idx, etapa in enumerate(etapas):
@@ -26,7 +12,7 @@ def nombre_unico(etapas, nombre, idx_editar=None):
 def modulo_etapas():
     st.header("🛠️ Gestión de Etapas de Producción")
 
-    etapas = cargar_etapas()
+    etapas = list(cargar_etapas())  # copia: la lista en caché es compartida
 
     # -------- FORMULARIO COMPACTO PARA MÓVIL --------
     with st.expander("➕ Agregar o editar etapa (formulario clásico)"):
@@ -52,6 +38,8 @@ def modulo_etapas():
                 personas_asignadas = st.number_input("Personas", min_value=1, value=etapa_actual.get('personas_asignadas',1))
                 horas_trabajo = st.number_input("Horas trabajo", min_value=0.0, step=0.5, value=etapa_actual.get('horas_trabajo',0.0))
                 eficiencia_esperada = st.slider("Eficiencia (%)", min_value=0, max_value=100, value=etapa_actual.get('eficiencia_esperada',100))
+                # Tras guardar la tabla, las etapas sin límite quedan con NaN o float
+                limite_wip = st.number_input("Límite WIP (0 = sin límite)", min_value=0, value=int(numero(etapa_actual.get('limite_wip'))))
 
             descripcion = st.text_area("Descripción", value=etapa_actual.get('descripcion',''), height=70)
 
@@ -73,7 +61,8 @@ def modulo_etapas():
                         "tiempo_mantenimiento": tiempo_mantenimiento,
                         "personas_asignadas": personas_asignadas,
                         "horas_trabajo": horas_trabajo,
-                        "eficiencia_esperada": eficiencia_esperada
+                        "eficiencia_esperada": eficiencia_esperada,
+                        "limite_wip": limite_wip
                     }
                     if idx_editar is not None:
                         etapas[idx_editar] = etapa_nueva
@@ -112,7 +101,8 @@ def modulo_etapas():
             "tiempo_mantenimiento": 0,
             "personas_asignadas": 1,
             "horas_trabajo": 0.0,
-            "eficiencia_esperada": 100
+            "eficiencia_esperada": 100,
+            "limite_wip": 0
         }])
 
         df_edit = st.data_editor(
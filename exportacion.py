@@ -0,0 +1,82 @@
+# ------------------ Exportación del historial de OPs ------------------ #
+# Genera el CSV/XLSX fila por fila desde la base (filtros aplicados en SQL),
+# escribiendo por bloques a un archivo temporal anónimo: nunca se arma la
+# lista completa ni el DataFrame en memoria, y el sistema borra el archivo al
+# cerrarse (no quedan exportaciones huérfanas de sesiones terminadas).
+import csv
+import importlib.util
+import io
+import json
+import tempfile
+import almacenamiento
+
+MIMES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+COLUMNAS = ["N° OP", "Cliente", "Producto", "Etapa", "Inicio", "Fin", "Duración (min)", "Observación", "Foto"]
+FILAS_POR_BLOQUE = 1000
+
+def convertir_fila(fila):
+    # Fila de almacenamiento.CONSULTA_HISTORIAL -> valores en el orden de COLUMNAS
+    numero_op, cliente, producto, etapa, inicio, fin, duracion_min, observacion, extras = fila
+    extras = json.loads(extras) if extras else {}
+    return [
+        numero_op,
+        cliente,
+        producto,
+        etapa,
+        inicio,
+        fin,
+        duracion_min if duracion_min is not None else "-",  # calculada al cerrar la etapa
+        observacion or "",
+        extras.get("foto_nombre", ""),
+    ]
+
+def filas_historial(desde=None, hasta=None, cliente=None):
+    for fila in almacenamiento.iterar_historial(desde, hasta, cliente):
+        yield convertir_fila(fila)
+
+def generar_csv(desde=None, hasta=None, cliente=None):
+    # Generador de bloques de bytes del CSV
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS)
+    for i, fila in enumerate(filas_historial(desde, hasta, cliente), start=1):
+        escritor.writerow(fila)
+        if i % FILAS_POR_BLOQUE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def formatos_disponibles():
+    # XLSX requiere openpyxl
+    return [f for f in MIMES if f != "xlsx" or importlib.util.find_spec("openpyxl")]
+
+def _libro_xlsx(desde=None, hasta=None, cliente=None):
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("Historial")
+    hoja.append(COLUMNAS)
+    for fila in filas_historial(desde, hasta, cliente):
+        hoja.append(fila)
+    return libro
+
+def exportar(formato, desde=None, hasta=None, cliente=None):
+    # Devuelve un archivo temporal abierto (al inicio) con la exportación completa.
+    # El libro XLSX se arma antes de crear el archivo: sin openpyxl no queda nada.
+    libro = _libro_xlsx(desde, hasta, cliente) if formato == "xlsx" else None
+    archivo = tempfile.TemporaryFile(prefix="historial_op_", suffix=f".{formato}")
+    try:
+        if libro is not None:
+            libro.save(archivo)
+        else:
+            for bloque in generar_csv(desde, hasta, cliente):
+                archivo.write(bloque)
+        archivo.seek(0)
+    except BaseException:
+        archivo.close()
+        raise
+    return archivo
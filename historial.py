@@ -1,34 +1,32 @@
 # ------------------ Módulo Historial OPs ------------------ #
 import streamlit as st
 import pandas as pd
-import json
-import os
-from datetime import datetime
-
-# Rutas de archivos
-OPS_FILE = "data/ordenes_produccion.json"
-USUARIOS_FILE = "data/usuarios.json"
-
+import functools
+import math
+from datos import cargar_etapas, cargar_indice_ops, consultar_historial, cargar_evidencias_ops
+import exportacion
+import login
+import medios
+import miniaturas
+
+TAMANOS_PAGINA = [25, 50, 100, 200]
+ORDEN_HISTORIAL = {
+    "creacion": "Fecha de creación",
+    "numero_op": "N° OP",
+    "cliente": "Cliente",
+    "producto": "Producto",
+    "etapa": "Etapa",
+    "inicio": "Inicio",
+    "fin": "Fin",
+    "duracion": "Duración (min)",
+}
 # ------------------ Funciones auxiliares ------------------ #
-def cargar_ops():
-    if os.path.exists(OPS_FILE):
-        with open(OPS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
-
 def get_usuario_actual():
     return st.session_state.get("usuario", None)
 
-def cargar_usuario_info():
-    if os.path.exists(USUARIOS_FILE):
-        with open(USUARIOS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
 def get_permisos_usuario(usuario):
-    usuarios = cargar_usuario_info()
-    info = usuarios.get(usuario, {})
-    return info.get("rol", ""), info.get("etapa_asignada", "")
+    # (rol, etapa) desde la caché de usuarios de login.py
+    return login.obtener_permisos(usuario)
 
 def acceso_restringido(roles_permitidos):
     usuario = get_usuario_actual()
@@ -46,57 +44,103 @@ def modulo_historial_ops():
 
     st.subheader("📚 Historial de Órdenes de Producción")
 
-    ops = cargar_ops()
-    if not ops:
+    indice_ops = cargar_indice_ops()
+    if not len(indice_ops):
         st.info("No hay datos de OPs registrados.")
         return
 
-    filtro_fecha = st.date_input("📅 Filtrar OPs por fecha de creación (opcional)", value=None)
-
-    historial_expandido = []
-
-    for op in ops:
-        historial = op.get("historial", [])
-        if filtro_fecha:
-            if not historial or 'inicio' not in historial[0]:
-                continue
-            fecha_inicio = datetime.fromisoformat(historial[0]["inicio"]).date()
-            if fecha_inicio != filtro_fecha:
-                continue
-
-        for etapa in historial:
-            inicio = etapa.get("inicio")
-            fin = etapa.get("fin")
-            duracion = "-"
-            if inicio and fin:
-                inicio_dt = datetime.fromisoformat(inicio)
-                fin_dt = datetime.fromisoformat(fin)
-                duracion = round((fin_dt - inicio_dt).total_seconds() / 60, 2)  # minutos
-
-            historial_expandido.append({
-                "N° OP": op["numero_op"],
-                "Cliente": op["cliente"],
-                "Producto": op["producto"],
-                "Etapa": etapa.get("etapa"),
-                "Inicio": inicio,
-                "Fin": fin,
-                "Duración (min)": duracion,
-                "Observación": etapa.get("observacion", ""),
-                "Foto": etapa.get("foto_nombre", "")
-            })
-
-    if not historial_expandido:
+    # Filtros, orden y paginación se resuelven en la base: solo se arma y se
+    # envía al navegador la página visible.
+    with st.expander("🔎 Filtros", expanded=True):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            rango = st.date_input("📅 Fecha de creación (opcional)", value=(), key="hist_rango")
+            prefijo_op = st.text_input("N° OP empieza con", key="hist_prefijo")
+        with col2:
+            cliente = st.selectbox("Cliente", ["Todos"] + sorted(indice_ops.clientes()), key="hist_cliente")
+            producto = st.text_input("Producto", key="hist_producto")
+        with col3:
+            etapa = st.selectbox("Etapa", ["Todas"] + [e["nombre"] for e in cargar_etapas()], key="hist_etapa")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        orden = st.selectbox("Ordenar por", list(ORDEN_HISTORIAL), format_func=ORDEN_HISTORIAL.get, key="hist_orden")
+    with col2:
+        descendente = st.checkbox("Descendente", key="hist_descendente")
+    with col3:
+        tamano = st.selectbox("Filas por página", TAMANOS_PAGINA, index=1, key="hist_tamano")
+
+    desde = rango[0].isoformat() if len(rango) > 0 else None
+    filtros = {
+        "desde": desde,
+        "hasta": rango[1].isoformat() if len(rango) > 1 else desde,
+        "cliente": None if cliente == "Todos" else cliente,
+        "producto": producto.strip() or None,
+        "etapa": None if etapa == "Todas" else etapa,
+        "prefijo_op": prefijo_op.strip() or None,
+    }
+
+    # Al cambiar filtros u orden se vuelve a la primera página
+    consulta = (sorted(filtros.items()), orden, descendente, tamano)
+    if st.session_state.get("hist_consulta") != consulta:
+        st.session_state["hist_consulta"] = consulta
+        st.session_state["hist_pagina"] = 1
+
+    pagina = st.session_state.get("hist_pagina", 1)
+    total, filas = consultar_historial(filtros, orden, descendente, tamano, (pagina - 1) * tamano)
+    total_paginas = max(1, math.ceil(total / tamano))
+    if pagina > total_paginas:
+        pagina = st.session_state["hist_pagina"] = total_paginas
+        total, filas = consultar_historial(filtros, orden, descendente, tamano, (pagina - 1) * tamano)
+
+    if not filas:
         st.info("No hay historial para mostrar.")
-        return
-
-    df = pd.DataFrame(historial_expandido)
-    st.dataframe(df, use_container_width=True)
-
-    # Descargar historial
-    csv = df.to_csv(index=False).encode("utf-8")
+    else:
+        df = pd.DataFrame([exportacion.convertir_fila(f) for f in filas], columns=exportacion.COLUMNAS)
+        st.dataframe(df, use_container_width=True, hide_index=True)
+
+        # Las fotos se suben con las alertas: se buscan las de las OPs de la página
+        fotos = cargar_evidencias_ops(df["N° OP"])
+        if fotos:
+            with st.expander(f"🖼️ Evidencias de esta página ({len(fotos)})"):
+                for foto in fotos:
+                    ruta_foto = medios.resolver(foto["foto_nombre"])
+                    st.markdown(f"**OP {foto['numero_op']}** — {foto['etapa']} · {foto['tipo_alerta']} ({(foto['fecha'] or '')[:16].replace('T', ' ')})")
+                    if ruta_foto:
+                        st.image(miniaturas.rendicion(ruta_foto, "mini"), width=200)
+                    else:
+                        st.warning(f"Foto no encontrada: {foto['foto_nombre']}")
+
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key="hist_pagina")
+    with col2:
+        st.caption(f"{total} filas · página {pagina} de {total_paginas}")
+
+    seccion_exportar()
+
+def seccion_exportar():
+    # El archivo se genera solo al pulsar "Descargar" (datos diferidos), no en
+    # cada render; Streamlit lo lee una vez y el temporal se borra al cerrarse
+    st.markdown("---")
+    st.subheader("⬇️ Exportar historial")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        rango = st.date_input("Rango de creación (opcional)", value=(), key="exp_rango")
+    with col2:
+        clientes = sorted(cargar_indice_ops().clientes())
+        cliente = st.selectbox("Cliente", ["Todos"] + clientes, key="exp_cliente")
+    with col3:
+        formato = st.radio("Formato", exportacion.formatos_disponibles(), horizontal=True, key="exp_formato")
+
+    desde = rango[0].isoformat() if len(rango) > 0 else None
+    hasta = rango[1].isoformat() if len(rango) > 1 else desde
     st.download_button(
-        label="⬇️ Descargar historial como CSV",
-        data=csv,
-        file_name="historial_op.csv",
-        mime="text/csv"
+        label=f"⬇️ Descargar historial como {formato.upper()}",
+        data=functools.partial(exportacion.exportar, formato, desde, hasta, None if cliente == "Todos" else cliente),
+        file_name=f"historial_op.{formato}",
+        mime=exportacion.MIMES[formato],
+        on_click="ignore",
+        key="exp_descargar",
     )
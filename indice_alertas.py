@@ -0,0 +1,30 @@
+# ------------------ Índice en memoria de alertas pendientes ------------------ #
+# Se construye una vez por cambio de alertas (datos.cargar_indice_alertas) y se
+# comparte entre sesiones. Cada sesión obtiene su subconjunto (por etapa, tipo
+# o usuario que reportó) en O(k) en lugar de recorrer todas las alertas.
+
+class IndiceAlertas:
+    def __init__(self, alertas):
+        self._todas = list(alertas)  # en orden de id
+        self._por_etapa = {}
+        self._por_tipo = {}
+        self._por_usuario = {}
+        for alerta in self._todas:
+            self._por_etapa.setdefault(alerta.get("etapa"), []).append(alerta)
+            self._por_tipo.setdefault(alerta.get("tipo_alerta"), []).append(alerta)
+            self._por_usuario.setdefault(alerta.get("usuario"), []).append(alerta)
+
+    def __len__(self):
+        return len(self._todas)
+
+    def todas(self):
+        return self._todas
+
+    def por_etapa(self, etapa):
+        return self._por_etapa.get(etapa, [])
+
+    def por_tipo(self, tipo):
+        return self._por_tipo.get(tipo, [])
+
+    def por_usuario(self, usuario):
+        return self._por_usuario.get(usuario, [])
@@ -0,0 +1,82 @@
+# ------------------ Índice en memoria de OPs ------------------ #
+# Se construye una vez por carga (datos.cargar_indice_ops) y se comparte entre
+# sesiones. Permite buscar por número de OP en O(1) y obtener las OPs de una
+# etapa o de un cliente en O(k), sin recorrer toda la lista en cada render.
+#
+# Las mutaciones son copy-on-write: nunca se modifica un dict de OP ni una
+# lista de un grupo que otra sesión pueda estar recorriendo; se reemplazan.
+
+class IndiceOPs:
+    def __init__(self, ops):
+        self._por_numero = {}
+        self._por_estado = {}
+        self._por_cliente = {}
+        for op in ops:
+            self._por_numero[op["numero_op"]] = op
+            self._por_estado.setdefault(op.get("estado_actual"), []).append(op)
+            self._por_cliente.setdefault(op.get("cliente"), []).append(op)
+
+    # ------------------ Consultas ------------------ #
+    def __len__(self):
+        return len(self._por_numero)
+
+    def __contains__(self, numero_op):
+        return numero_op in self._por_numero
+
+    def obtener(self, numero_op):
+        return self._por_numero.get(numero_op)
+
+    def todas(self):
+        return list(self._por_numero.values())
+
+    def por_estado(self, estado):
+        return self._por_estado.get(estado, [])
+
+    def por_cliente(self, cliente):
+        return self._por_cliente.get(cliente, [])
+
+    def clientes(self):
+        return [c for c in self._por_cliente if c]
+
+    # ------------------ Mutaciones ------------------ #
+    @staticmethod
+    def _agregar_en(grupos, clave, op):
+        grupos[clave] = grupos.get(clave, []) + [op]
+
+    @staticmethod
+    def _quitar_de(grupos, clave, numero_op):
+        restantes = [o for o in grupos.get(clave, []) if o["numero_op"] != numero_op]
+        if restantes:
+            grupos[clave] = restantes
+        else:
+            grupos.pop(clave, None)
+
+    def agregar(self, op):
+        if op["numero_op"] in self._por_numero:
+            self.quitar(op["numero_op"])
+        self._por_numero[op["numero_op"]] = op
+        self._agregar_en(self._por_estado, op.get("estado_actual"), op)
+        self._agregar_en(self._por_cliente, op.get("cliente"), op)
+
+    def quitar(self, numero_op):
+        op = self._por_numero.pop(numero_op, None)
+        if op is not None:
+            self._quitar_de(self._por_estado, op.get("estado_actual"), numero_op)
+            self._quitar_de(self._por_cliente, op.get("cliente"), numero_op)
+        return op
+
+    def actualizar(self, numero_op, cambios):
+        op = self._por_numero.get(numero_op)
+        if op is None:
+            return None
+        nueva = dict(op)
+        nueva.update(cambios)
+        # Reemplaza en su lugar para conservar el orden de la OP en los grupos
+        self._por_numero[numero_op] = nueva
+        for grupos, campo in ((self._por_estado, "estado_actual"), (self._por_cliente, "cliente")):
+            if op.get(campo) == nueva.get(campo):
+                grupos[op.get(campo)] = [nueva if o["numero_op"] == numero_op else o for o in grupos[op.get(campo)]]
+            else:
+                self._quitar_de(grupos, op.get(campo), numero_op)
+                self._agregar_en(grupos, nueva.get(campo), nueva)
+        return nueva
@@ -1,95 +1,452 @@
 import streamlit as st
-import json
-import os
 from datetime import datetime
-import uuid
 import shutil  # para guardar archivos
-from pathlib import Path
-import time
-
-ETAPAS_FILE = "data/etapas.json"
-OPS_FILE = "data/ordenes_produccion.json"
-TRAZABILIDAD_FILE = "data/trazabilidad.json"
-USUARIOS_FILE = "data/usuarios.json"
-ALERTAS_FILE = "data/alertas_pendientes.json"
-EVIDENCIA_DIR = "evidencias"
-IMAGENES_DIR = Path("files/imagenes_op")  # Usamos pathlib para mayor compatibilidad
-
-def cargar_etapas():
-    if os.path.exists(ETAPAS_FILE):
-        with open(ETAPAS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
-
-def cargar_ops():
-    if os.path.exists(OPS_FILE):
-        with open(OPS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
-
-def guardar_ops(ops):
-    os.makedirs(os.path.dirname(OPS_FILE), exist_ok=True)
-    with open(OPS_FILE, "w", encoding="utf-8") as f:
-        json.dump(ops, f, indent=4, ensure_ascii=False)
-
-def guardar_trazabilidad(data):
-    os.makedirs(os.path.dirname(TRAZABILIDAD_FILE), exist_ok=True)
-    if os.path.exists(TRAZABILIDAD_FILE):
-        with open(TRAZABILIDAD_FILE, "r", encoding="utf-8") as f:
-            historial = json.load(f)
-    else:
-        historial = []
-    historial.append(data)
-    with open(TRAZABILIDAD_FILE, "w", encoding="utf-8") as f:
-        json.dump(historial, f, indent=4, ensure_ascii=False)
+import math
+import miniaturas
+import medios
+import login
+from numeros import numero
+from datos import cargar_etapas, cargar_indice_ops
+from datos import agregar_alerta_pendiente, avanzar_etapa, dividir_op, guardar_evidencia, ConflictoVersion
+from datos import leer_cronometro, iniciar_cronometro, pausar_cronometro, detener_cronometro
+from datos import planificacion_vigente, cargar_semaforo
+from almacen_evidencias import EvidenciaDemasiadoGrande
+
+TARJETAS_POR_PAGINA = 8  # tarjetas visibles por columna
+INTERVALO_CAMBIOS_S = 2  # cada cuánto se revisa si otra sesión movió una OP
+INTERVALO_CRONOMETRO_S = 5  # refresco del tiempo mostrado en el cronómetro
 
 def get_usuario_actual():
     return st.session_state.get("usuario", None)
 
-def cargar_usuario_info():
-    if os.path.exists(USUARIOS_FILE):
-        with open(USUARIOS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
 def get_permisos_usuario(usuario):
-    usuarios = cargar_usuario_info()
-    info = usuarios.get(usuario, {})
-    return info.get("rol", ""), info.get("etapa_asignada", "")
+    # (rol, etapa) desde la caché de usuarios de login.py
+    return login.obtener_permisos(usuario)
 
 def chunk_list(lst, n):
     for i in range(0, len(lst), n):
         yield lst[i:i+n]
 
-def guardar_evidencia(archivo, numero_op, etapa):
-    if archivo:
-        os.makedirs(EVIDENCIA_DIR, exist_ok=True)
-        extension = os.path.splitext(archivo.name)[1]
-        nombre_archivo = f"{numero_op}_{etapa}_{uuid.uuid4().hex}{extension}"
-        ruta_archivo = os.path.join(EVIDENCIA_DIR, nombre_archivo)
-        with open(ruta_archivo, "wb") as f:
-            f.write(archivo.read())
-        return nombre_archivo
-    return None
+def recordar_version(numero_op, version):
+    # on_click corre antes del rerun: guarda la versión de la OP que el
+    # operario tenía en pantalla al pulsar, no la que se lea después.
+    st.session_state[f"version_vista_{numero_op}"] = version
+
+def version_vista(op):
+    return st.session_state.pop(f"version_vista_{op['numero_op']}", op.get("version"))
+
+def formato_duracion(segundos):
+    minutos, segundos = divmod(int(segundos), 60)
+    horas, minutos = divmod(minutos, 60)
+    return f"{horas:02d}:{minutos:02d}:{segundos:02d}"
+
+@st.fragment(run_every=INTERVALO_CRONOMETRO_S)
+def mostrar_cronometro(numero_op, etapa, usuario):
+    # El cronómetro vive en la base (no en la sesión): sigue corriendo entre
+    # reruns, reconexiones y reinicios, y su tiempo se envía al avanzar la etapa.
+    cronometro = leer_cronometro(numero_op, etapa)
+    estado = cronometro["estado"] if cronometro else None
+
+    if cronometro:
+        iconos = {"corriendo": "▶️", "pausado": "⏸", "detenido": "⏹"}
+        st.metric(f"{iconos[estado]} Tiempo de proceso ({estado})", formato_duracion(cronometro["segundos"]))
+    else:
+        st.caption("Cronómetro sin iniciar.")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        etiqueta = {"pausado": "▶️ Reanudar", "detenido": "🔄 Reiniciar"}.get(estado, "▶️ Iniciar proceso")
+        if st.button(etiqueta, key=f"iniciar_{numero_op}", disabled=estado == "corriendo"):
+            iniciar_cronometro(numero_op, etapa, usuario)
+            st.rerun(scope="fragment")
+    with col2:
+        if st.button("⏸ Pausar", key=f"pausar_{numero_op}", disabled=estado != "corriendo"):
+            pausar_cronometro(numero_op, etapa)
+            st.rerun(scope="fragment")
+    with col3:
+        if st.button("⏹ Finalizar proceso", key=f"fin_{numero_op}", disabled=estado not in ("corriendo", "pausado")):
+            detener_cronometro(numero_op, etapa)
+            st.rerun(scope="fragment")
+
+def mostrar_detalle_op(op, usuario):
+    # Widgets pesados (imagen, alertas, división y registro de etapa): solo se
+    # crean para la tarjeta que el operario tiene abierta.
+    st.markdown(f"**Cliente:** {op['cliente']}")
+    st.markdown(f"**Cantidad:** {op['cantidad']}")
+
+
+
+    # Obtener el nombre del archivo de imagen registrado en la OP
+    imagen_op = op.get("imagen_op")
+    imagen_estado = op.get("imagen_estado")
+
+    if imagen_estado == "procesando":
+        st.info("⏳ El PDF de esta OP se está convirtiendo a imágenes.")
+    elif imagen_estado == "error":
+        st.warning(f"⚠️ No se pudo convertir el PDF de la OP: {op.get('imagen_error', '')}")
+    elif imagen_op:
+        ruta_imagen = medios.resolver(imagen_op)
+
+        if ruta_imagen:
+            # Checkbox (no botón) para que el selector de página no cierre la vista
+            if st.checkbox("🔍 Visualizar OP", key=f"ver_imagen_{op['numero_op']}"):
+                tab1, tab2 = st.tabs(["Detalles OP", "Imagen OP"])
+
+                with tab1:
+                    # Aquí pones todos los detalles de la OP que quieras mostrar
+                    st.markdown(f"- **Cliente:** {op.get('cliente', '-')}")
+                    st.markdown(f"- **Producto:** {op.get('producto', '-')}")
+                    st.markdown(f"- **Cantidad:** {op.get('cantidad', '-')}")
+                    st.markdown(f"- **Fecha de entrega:** {op.get('fecha_entrega', '-')}")
+                    st.markdown(f"- **Etapas:** {', '.join(op.get('etapas', []))}")
+                    mostrar_planificacion(op)
+
+                with tab2:
+                    paginas = op.get("paginas_op") or []
+                    if len(paginas) > 1:
+                        # Todas las páginas del PDF: vistas previas y la página elegida completa
+                        st.image([miniaturas.rendicion(medios.resolver(p["preview"]) or p["preview"], "mini") for p in paginas], caption=[f"Pág. {p['pagina']}" for p in paginas])
+                        numero = st.select_slider("Página", options=[p["pagina"] for p in paginas], key=f"pagina_pdf_{op['numero_op']}")
+                        ruta_imagen = medios.resolver(paginas[numero - 1]["completa"]) or ruta_imagen
+                    st.image(miniaturas.rendicion(ruta_imagen, "media"), caption=f"OP: {op['numero_op']} - Imagen asociada", use_container_width=True)
+        else:
+            st.warning(f"⚠️ La imagen asociada no se encontró: {imagen_op}")
+    else:
+        st.info("🖼️ Esta OP no tiene imagen registrada.")
+
+    mostrar_alerta = st.checkbox("📢 Reportar alerta", key=f"ver_alerta_{op['numero_op']}")
+
+    if mostrar_alerta:
+        st.markdown("**Tipo de alerta**")
+        notif_maquina = st.checkbox("Report. máquina malograda (TPM)", key=f"notif_maquina_{op['numero_op']}")
+        notif_descanso = st.checkbox("Paro Almuerzo (1h) (Gestión Visual / TPM)", key=f"notif_descanso_{op['numero_op']}")
+        notif_material = st.checkbox("Reabastecimiento-material (Just-In-Time)", key=f"notif_material_{op['numero_op']}")
+        notif_op_fisica = st.checkbox("No tiene OP física (Gestión Visual)", key=f"notif_op_fisica_{op['numero_op']}")
+
+        st.markdown("**Subir Evidencia**")
+        evidencia = st.file_uploader("Foto (opcional)", type=["png", "jpg", "jpeg"], key=f"foto_{op['numero_op']}")
+        comentario = st.text_area("Comentario breve", key=f"comentario_{op['numero_op']}")
+
+        # Evaluación de alertas (no modificado)
+        tipo_alerta = None
+        color_alerta = None
+        if notif_maquina:
+            tipo_alerta = "Máquina malograda"
+            color_alerta = "red"
+        elif notif_material or notif_op_fisica:
+            tipo_alerta = "Falta de material o sin OP física"
+            color_alerta = "orange"
+
+        if tipo_alerta:
+            if st.button(f"🚨 Enviar alerta de: {tipo_alerta}", key=f"alerta_{op['numero_op']}"):
+                now = datetime.now().isoformat()
+                etapa_actual = op["estado_actual"]
+                try:
+                    nombre_foto = guardar_evidencia(evidencia) if evidencia else None
+                except EvidenciaDemasiadoGrande as e:
+                    st.error(f"❌ {e}")
+                    st.stop()
+
+                alerta = {
+                    "numero_op": op["numero_op"],
+                    "cliente": op["cliente"],
+                    "producto": op["producto"],
+                    "fecha": now,
+                    "usuario": usuario,
+                    "etapa": etapa_actual,
+                    "tipo_alerta": tipo_alerta,
+                    "color": color_alerta,
+                    "comentario": comentario,
+                    "foto_nombre": nombre_foto
+                }
+
+                agregar_alerta_pendiente(
+                    alerta,
+                    cambios_op={"color_alerta": color_alerta},
+                    evento={
+                        "op": op["numero_op"],
+                        "fecha": now,
+                        "usuario": usuario,
+                        "etapa_anterior": etapa_actual,
+                        "etapa_nueva": etapa_actual,
+                        "tipo_alerta": tipo_alerta,
+                        "comentario": comentario,
+                        "foto_nombre": nombre_foto
+                    }
+                )
+
+                st.success(f"🚨 Alerta registrada en etapa: {etapa_actual}")
+                st.rerun()
+
+
+    st.markdown("---")
+    st.markdown("🔁 **Duplicar OP**")
+    if st.checkbox("➕ Dividir OP", key=f"dividir_{op['numero_op']}"):
+        num_subops = st.number_input("¿En cuántas partes quieres dividir esta OP?", min_value=2, max_value=10, step=1, key=f"n_partes_{op['numero_op']}")
+
+        cantidades = []
+        total_distribuido = 0
+        for i in range(num_subops):
+            cantidad_subop = st.number_input(
+                f"Cantidad para sub-OP {i+1}",
+                min_value=0,
+                key=f"cantidad_subop_{op['numero_op']}_{i}"
+            )
+            cantidades.append(cantidad_subop)
+            total_distribuido += cantidad_subop
+
+        cantidad_original = op.get("cantidad", 0)
+        diferencia = cantidad_original - total_distribuido
+
+        if diferencia < 0:
+            st.error(f"La suma de las cantidades excede la cantidad original de {cantidad_original}")
+        elif diferencia > 0:
+            st.warning(f"Aún faltan distribuir {diferencia} unidades")
+        else:
+            if st.button("✅ Confirmar y crear sub-OPs", key=f"btn_confirmar_{op['numero_op']}",
+                         on_click=recordar_version, args=(op["numero_op"], op.get("version"))):
+                nuevas_ops = []
+                sufijos = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+                for i in range(num_subops):
+                    nueva_op = op.copy()
+                    nueva_op["numero_op"] = f"{op['numero_op']}-{sufijos[i]}"
+                    nueva_op["cantidad"] = cantidades[i]
+                    nueva_op["estado_actual"] = op["estado_actual"]
+                    nuevas_ops.append(nueva_op)
+
+                # Eliminar la OP original, agregar las nuevas y registrar en trazabilidad
+                eventos = []
+                for subop in nuevas_ops:
+                    eventos.append({
+                        "op": subop["numero_op"],
+                        "fecha": datetime.now().isoformat(),
+                        "usuario": usuario,
+                        "etapa_anterior": op["estado_actual"],
+                        "etapa_nueva": op["estado_actual"],
+                        "tipo_alerta": "Subdivisión de OP",
+                        "comentario": f"Creada como parte de subdivisión de {op['numero_op']}"
+                    })
+                try:
+                    dividir_op(op["numero_op"], nuevas_ops, eventos, version=version_vista(op))
+                except ConflictoVersion:
+                    st.warning("⚠️ Otro usuario modificó esta OP mientras la dividías. Revisa los datos actualizados.")
+                else:
+                    st.success(f"✔️ OP dividida exitosamente en {num_subops} sub-OPs.")
+                    st.rerun()
+    etapa_actual = op["estado_actual"]
+    if etapa_actual in op["etapas"]:
+        indice_etapa = op["etapas"].index(etapa_actual)
+    else:
+        st.error(f"Error: La etapa '{etapa_actual}' no está en las etapas de OP {op['numero_op']}.")
+        return
+
+    puede_avanzar = indice_etapa < len(op["etapas"]) - 1
+    siguiente_etapa = op["etapas"][indice_etapa + 1] if puede_avanzar else None
+
+    if puede_avanzar:
+        datos = {
+            "cantidad_inicial": op.get("cantidad", 0),
+            "tiempo_total": None,
+            "personas": None
+        }
+
+        numero_op = op["numero_op"]
+        mostrar_formulario = st.checkbox("📝 Registrar datos de etapa", key=f"check_formulario_{numero_op}")
+
+        if mostrar_formulario:
+            st.subheader("📊 Registro de Cantidades")
+            st.info(f"Cantidad inicial: **{datos['cantidad_inicial']}** unidades")
+
+            mt_utilizada = st.number_input("Cantidad de materia prima utilizada (MT)", min_value=0, key=f"mt_{numero_op}")
+            merma = st.number_input("Cantidad de merma", min_value=0, key=f"merma_{numero_op}")
+
+            cantidad_final = mt_utilizada - merma
+            st.success(f"Cantidad final: **{cantidad_final}** unidades")
+
+            mostrar_tiempos = st.checkbox("⏱️ Registrar tiempos VSM", key=f"check_tiempos_{numero_op}")
+            if mostrar_tiempos:
+                st.subheader("📈 Tiempos VSM")
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    setup_time = st.number_input("Setup Time (min)", min_value=0, key=f"setup_{numero_op}")
+                with col2:
+                    cycle_time = st.number_input("Cycle Time por unidad (seg)", min_value=0, key=f"cycle_{numero_op}")
+                with col3:
+                    idle_time = st.number_input("Idle Time (min)", min_value=0, key=f"idle_{numero_op}")
+
+            mostrar_crono = st.checkbox("🕒 Iniciar proceso con cronómetro", key=f"check_crono_{numero_op}")
+            if mostrar_crono:
+                mostrar_cronometro(numero_op, etapa_actual, usuario)
+                cronometro = leer_cronometro(numero_op, etapa_actual)
+                if cronometro:
+                    datos["tiempo_total"] = round(cronometro["segundos"] / 60, 2)
+
+            mostrar_personas = st.checkbox("👥 Registrar número de personas", key=f"check_personas_{numero_op}")
+            if mostrar_personas:
+                personas = st.number_input("Número de personas involucradas", min_value=1, key=f"personas_{numero_op}")
+                datos["personas"] = personas
+
+            st.subheader("📄 Resumen de etapa")
+            st.write(f"- Cantidad inicial: {datos['cantidad_inicial']}")
+            st.write(f"- MT utilizada: {mt_utilizada}")
+            st.write(f"- Merma: {merma}")
+            st.write(f"- Cantidad final: {cantidad_final}")
+            if mostrar_tiempos:
+                st.write(f"- Setup Time: {setup_time} min")
+                st.write(f"- Cycle Time: {cycle_time} seg")
+                st.write(f"- Idle Time: {idle_time} min")
+            if datos["tiempo_total"]:
+                st.write(f"- Tiempo total proceso: {datos['tiempo_total']} min")
+            if mostrar_personas:
+                st.write(f"- Personas involucradas: {datos['personas']}")
+
+            if st.button("📤 Enviar a siguiente etapa", key=f"btn_avanzar_{numero_op}",
+                         on_click=recordar_version, args=(numero_op, op.get("version"))):
+                try:
+                    avanzar_etapa(numero_op, {
+                        "estado_actual": siguiente_etapa,
+                        "cantidad": cantidad_final
+                    }, {
+                        "op": numero_op,
+                        "fecha": datetime.now().isoformat(),
+                        "usuario": usuario,
+                        "etapa_anterior": etapa_actual,
+                        "etapa_nueva": siguiente_etapa,
+                        "datos_etapa": {
+                            "mt_utilizada": mt_utilizada,
+                            "merma": merma,
+                            "cantidad_final": cantidad_final,
+                            "setup_time": setup_time if mostrar_tiempos else None,
+                            "cycle_time": cycle_time if mostrar_tiempos else None,
+                            "idle_time": idle_time if mostrar_tiempos else None,
+                            "tiempo_total": datos["tiempo_total"],
+                            "personas": datos["personas"]
+                        }
+                    }, version=version_vista(op))
+                except ConflictoVersion:
+                    st.warning("⚠️ Otro operario ya movió o dividió esta OP. Revisa el tablero antes de volver a enviarla.")
+                else:
+                    st.success(f"✅ OP {numero_op} enviada a etapa: {siguiente_etapa}")
+                    st.rerun()
+    else:
+        st.success("✅ Esta OP ha completado todas sus etapas.")
+
+def mostrar_planificacion(op):
+    # Plan a capacidad finita (planificador.py), recalculado en segundo plano
+    plan = op.get("planificacion") or {}
+    if not plan:
+        return
+    fin = op.get("fecha_fin_estimada", "").replace("T", " ")
+    if op.get("en_riesgo"):
+        st.markdown(f"- ⚠️ **Fin estimado:** {fin} (después de la entrega)")
+    else:
+        st.markdown(f"- **Fin estimado:** {fin}")
+    for etapa, tramo in plan.items():
+        st.caption(f"{etapa}: {tramo['inicio'].replace('T', ' ')} → {tramo['fin'].replace('T', ' ')}")
+
+def icono_estado(op, colores):
+    # colores: semáforo automático de cargar_semaforo() (ya incluye el color
+    # de las alertas pendientes); las OPs terminadas usan solo el de la alerta.
+    color = colores.get(op["numero_op"], op.get("color_alerta"))
+    if color == "red":
+        return "🔴"
+    if color in ("yellow", "orange"):
+        return "🟡"
+    return "🟢"
+
+def abrir_op(numero_op):
+    st.session_state["op_abierta"] = numero_op
+
+def cerrar_op():
+    st.session_state.pop("op_abierta", None)
+
+def cambiar_pagina(clave, delta):
+    st.session_state[clave] = st.session_state.get(clave, 0) + delta
+
+def mostrar_encabezado_etapa(etapa, total):
+    st.markdown(f"<h6 style='text-align: center;'>{etapa['nombre']}➡️</h6>", unsafe_allow_html=True)
+    limite = int(numero(etapa.get("limite_wip")))  # celdas vacías del editor de etapas: 0
+    if limite:
+        if total > limite:
+            st.markdown(f"<p style='text-align: center; color: red;'>🔢 WIP {total} / {limite}</p>", unsafe_allow_html=True)
+        else:
+            st.markdown(f"<p style='text-align: center; color: gray;'>🔢 WIP {total} / {limite}</p>", unsafe_allow_html=True)
+    else:
+        st.markdown(f"<p style='text-align: center; color: gray;'>🔢 WIP {total}</p>", unsafe_allow_html=True)
+
+def paginar(ops, nombre_etapa):
+    clave = f"pagina_{nombre_etapa}"
+    total_paginas = max(1, math.ceil(len(ops) / TARJETAS_POR_PAGINA))
+    pagina = min(max(st.session_state.get(clave, 0), 0), total_paginas - 1)
+    st.session_state[clave] = pagina
+
+    if total_paginas > 1:
+        col_ant, col_pag, col_sig = st.columns([1, 2, 1])
+        with col_ant:
+            st.button("◀", key=f"ant_{clave}", disabled=pagina == 0, on_click=cambiar_pagina, args=(clave, -1))
+        with col_pag:
+            st.caption(f"{pagina + 1}/{total_paginas}")
+        with col_sig:
+            st.button("▶", key=f"sig_{clave}", disabled=pagina == total_paginas - 1, on_click=cambiar_pagina, args=(clave, 1))
+
+    inicio = pagina * TARJETAS_POR_PAGINA
+    return ops[inicio:inicio + TARJETAS_POR_PAGINA]
+
+def mostrar_tarjeta(op, colores):
+    # Tarjeta compacta: un texto y un botón, sin widgets del detalle
+    with st.container(border=True):
+        st.markdown(f"{icono_estado(op, colores)} **OP: {op['numero_op']}** - {op['producto']}")
+        riesgo = " · ⚠️ en riesgo" if op.get("en_riesgo") else ""
+        st.caption(f"{op['cliente']} · {op['cantidad']} u.{riesgo}")
+        st.button("Abrir", key=f"abrir_{op['numero_op']}", on_click=abrir_op, args=(op["numero_op"],))
+
+@st.fragment
+def mostrar_tarjeta_abierta(numero_op, usuario):
+    # Fragmento: los checkboxes e inputs de la tarjeta solo vuelven a ejecutar
+    # esta función, no toda la app. Cada ejecución relee la OP por su número
+    # desde el índice en caché; las acciones que mueven la OP de columna
+    # (avanzar, dividir, alertar) piden st.rerun() solo en la sesión que actúa.
+    op = cargar_indice_ops().obtener(numero_op)
+    with st.container(border=True):
+        if op is None:
+            st.info(f"La OP {numero_op} ya no está en el tablero.")
+            return
+        st.markdown(f"{icono_estado(op, cargar_semaforo())} **OP: {op['numero_op']} - {op['producto']}**")
+        if st.button("✖ Cerrar", key=f"cerrar_{op['numero_op']}"):
+            cerrar_op()
+            st.rerun()
+        mostrar_detalle_op(op, usuario)
 
 def tablero_kanban():
     st.subheader("📊 Tablero Kanban de Producción")
-
+    usuario = get_usuario_actual()
+    if not usuario:
+        st.warning("No has iniciado sesión.")
+        return
+    cuerpo_tablero(usuario)
+
+@st.fragment(run_every=INTERVALO_CAMBIOS_S)
+def cuerpo_tablero(usuario):
+    # Fragmento: se redibuja solo cada INTERVALO_CAMBIOS_S, sin rerun de la
+    # app ni del sidebar, y muestra lo que otras sesiones movieron, dividieron
+    # o marcaron. Las lecturas salen de la caché de datos (sin parsear nada
+    # mientras la base no cambie).
+    planificacion_vigente()
     etapas = cargar_etapas()
-    ops = cargar_ops()
+    indice_ops = cargar_indice_ops()
 
     if not etapas:
         st.warning("No hay etapas creadas.")
         return
-    if not ops:
+    if not len(indice_ops):
         st.info("No hay OPs creadas.")
         return
 
-    usuario = get_usuario_actual()
-    if not usuario:
-        st.warning("No has iniciado sesión.")
-        return
-    rol, etapa_asignada = get_permisos_usuario(usuario)
+    colores = cargar_semaforo()  # un cálculo por versión de datos, no por tarjeta
+
+    op_abierta = st.session_state.get("op_abierta")
+    if op_abierta not in indice_ops:
+        op_abierta = None
 
     max_cols = 7
     filas_etapas = list(chunk_list(etapas, max_cols))
@@ -98,276 +455,13 @@ def tablero_kanban():
         columnas = st.columns(len(fila_etapas))
         for i, etapa in enumerate(fila_etapas):
             with columnas[i]:
-                st.markdown(f"<h6 style='text-align: center;'>{etapa['nombre']}➡️</h6>", unsafe_allow_html=True)
-                ops_en_etapa = [op for op in ops if op["estado_actual"] == etapa["nombre"]]
-
-                for op in ops_en_etapa:
-                    # Determinar ícono y color del estado
-                    color_fondo = "🟢"
-                    if "color_alerta" in op:
-                        if op["color_alerta"] == "red":
-                            color_fondo = "🔴"
-                        elif op["color_alerta"] == "orange":
-                            color_fondo = "🟡"
-
-                    # Construir expander con ícono de estado
-                    with st.expander(f"{color_fondo} OP: {op['numero_op']} - {op['producto']}"):
-                        
-                        st.markdown(f"**Cliente:** {op['cliente']}")
-                        st.markdown(f"**Cantidad:** {op['cantidad']}")
-
-
-                        
-                        # Obtener el nombre del archivo de imagen registrado en la OP
-                        imagen_op = op.get("imagen_op")
-
-                        if imagen_op:
-                            ruta_imagen = IMAGENES_DIR / Path(imagen_op).name  # Componemos ruta usando pathlib
-
-                            if ruta_imagen.exists():
-                                if st.button(f"🔍 Visualizar OP", key=f"ver_imagen_{op['numero_op']}"):
-                                    tab1, tab2 = st.tabs(["Detalles OP", "Imagen OP"])
-
-                                    with tab1:
-                                        # Aquí pones todos los detalles de la OP que quieras mostrar
-                                        st.markdown(f"- **Cliente:** {op.get('cliente', '-')}")
-                                        st.markdown(f"- **Producto:** {op.get('producto', '-')}")
-                                        st.markdown(f"- **Cantidad:** {op.get('cantidad', '-')}")
-                                        st.markdown(f"- **Fecha de entrega:** {op.get('fecha_entrega', '-')}")
-                                        st.markdown(f"- **Etapas:** {', '.join(op.get('etapas', []))}")
-
-                                    with tab2:
-                                        st.image(str(ruta_imagen), caption=f"OP: {op['numero_op']} - Imagen asociada", use_container_width=True)
-                            else:
-                                st.warning(f"⚠️ La imagen asociada no se encontró en: {ruta_imagen}")
-                        else:
-                            st.info("🖼️ Esta OP no tiene imagen registrada.")
-
-                        mostrar_alerta = st.checkbox("📢 Reportar alerta", key=f"ver_alerta_{op['numero_op']}")
-
-                        if mostrar_alerta:
-                            st.markdown("**Tipo de alerta**")
-                            notif_maquina = st.checkbox("Report. máquina malograda (TPM)", key=f"notif_maquina_{op['numero_op']}")
-                            notif_descanso = st.checkbox("Paro Almuerzo (1h) (Gestión Visual / TPM)", key=f"notif_descanso_{op['numero_op']}")
-                            notif_material = st.checkbox("Reabastecimiento-material (Just-In-Time)", key=f"notif_material_{op['numero_op']}")
-                            notif_op_fisica = st.checkbox("No tiene OP física (Gestión Visual)", key=f"notif_op_fisica_{op['numero_op']}")
-
-                            st.markdown("**Subir Evidencia**")
-                            evidencia = st.file_uploader("Foto (opcional)", type=["png", "jpg", "jpeg"], key=f"foto_{op['numero_op']}")
-                            comentario = st.text_area("Comentario breve", key=f"comentario_{op['numero_op']}")
-
-                            # Evaluación de alertas (no modificado)
-                            tipo_alerta = None
-                            color_alerta = None
-                            if notif_maquina:
-                                tipo_alerta = "Máquina malograda"
-                                color_alerta = "red"
-                            elif notif_material or notif_op_fisica:
-                                tipo_alerta = "Falta de material o sin OP física"
-                                color_alerta = "orange"
-
-                            if tipo_alerta:
-                                if st.button(f"🚨 Enviar alerta de: {tipo_alerta}", key=f"alerta_{op['numero_op']}"):
-                                    now = datetime.now().isoformat()
-                                    etapa_actual = op["estado_actual"]
-                                    nombre_foto = guardar_evidencia(evidencia, op["numero_op"], etapa_actual)
-
-                                    alerta = {
-                                        "numero_op": op["numero_op"],
-                                        "cliente": op["cliente"],
-                                        "producto": op["producto"],
-                                        "fecha": now,
-                                        "usuario": usuario,
-                                        "etapa": etapa_actual,
-                                        "tipo_alerta": tipo_alerta,
-                                        "color": color_alerta,
-                                        "comentario": comentario,
-                                        "foto_nombre": nombre_foto
-                                    }
-
-                                    os.makedirs(os.path.dirname(ALERTAS_FILE), exist_ok=True)
-                                    if os.path.exists(ALERTAS_FILE):
-                                        with open(ALERTAS_FILE, "r", encoding="utf-8") as f:
-                                            alertas = json.load(f)
-                                    else:
-                                        alertas = []
-                                    alertas.append(alerta)
-                                    with open(ALERTAS_FILE, "w", encoding="utf-8") as f:
-                                        json.dump(alertas, f, indent=4, ensure_ascii=False)
-
-                                    op["color_alerta"] = color_alerta
-                                    guardar_ops(ops)
-
-                                    guardar_trazabilidad({
-                                        "op": op["numero_op"],
-                                        "fecha": now,
-                                        "usuario": usuario,
-                                        "etapa_anterior": etapa_actual,
-                                        "etapa_nueva": etapa_actual,
-                                        "tipo_alerta": tipo_alerta,
-                                        "comentario": comentario,
-                                        "foto_nombre": nombre_foto
-                                    })
-
-                                    st.success(f"🚨 Alerta registrada en etapa: {etapa_actual}")
-                                    st.rerun()
-
-                                
-                        st.markdown("---")
-                        st.markdown("🔁 **Duplicar OP**")
-                        if st.checkbox("➕ Dividir OP", key=f"dividir_{op['numero_op']}"):
-                            num_subops = st.number_input("¿En cuántas partes quieres dividir esta OP?", min_value=2, max_value=10, step=1, key=f"n_partes_{op['numero_op']}")
-
-                            cantidades = []
-                            total_distribuido = 0
-                            for i in range(num_subops):
-                                cantidad_subop = st.number_input(
-                                    f"Cantidad para sub-OP {i+1}",
-                                    min_value=0,
-                                    key=f"cantidad_subop_{op['numero_op']}_{i}"
-                                )
-                                cantidades.append(cantidad_subop)
-                                total_distribuido += cantidad_subop
-
-                            cantidad_original = op.get("cantidad", 0)
-                            diferencia = cantidad_original - total_distribuido
-
-                            if diferencia < 0:
-                                st.error(f"La suma de las cantidades excede la cantidad original de {cantidad_original}")
-                            elif diferencia > 0:
-                                st.warning(f"Aún faltan distribuir {diferencia} unidades")
-                            else:
-                                if st.button("✅ Confirmar y crear sub-OPs", key=f"btn_confirmar_{op['numero_op']}"):
-                                    nuevas_ops = []
-                                    sufijos = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-                                    for i in range(num_subops):
-                                        nueva_op = op.copy()
-                                        nueva_op["numero_op"] = f"{op['numero_op']}-{sufijos[i]}"
-                                        nueva_op["cantidad"] = cantidades[i]
-                                        nueva_op["estado_actual"] = op["estado_actual"]
-                                        nuevas_ops.append(nueva_op)
-
-                                    # Eliminar la OP original y agregar las nuevas
-                                    ops = [o for o in ops if o["numero_op"] != op["numero_op"]]
-                                    ops.extend(nuevas_ops)
-
-                                    guardar_ops(ops)
-
-                                    # Registrar en trazabilidad
-                                    for subop in nuevas_ops:
-                                        guardar_trazabilidad({
-                                            "op": subop["numero_op"],
-                                            "fecha": datetime.now().isoformat(),
-                                            "usuario": usuario,
-                                            "etapa_anterior": op["estado_actual"],
-                                            "etapa_nueva": op["estado_actual"],
-                                            "tipo_alerta": "Subdivisión de OP",
-                                            "comentario": f"Creada como parte de subdivisión de {op['numero_op']}"
-                                        })
-
-                                    st.success(f"✔️ OP dividida exitosamente en {num_subops} sub-OPs.")
-                                    st.rerun()
-                        etapa_actual = op["estado_actual"]
-                        if etapa_actual in op["etapas"]:
-                            indice_etapa = op["etapas"].index(etapa_actual)
-                        else:
-                            st.error(f"Error: La etapa '{etapa_actual}' no está en las etapas de OP {op['numero_op']}.")
-                            continue
-
-                        puede_avanzar = indice_etapa < len(op["etapas"]) - 1
-                        siguiente_etapa = op["etapas"][indice_etapa + 1] if puede_avanzar else None
-
-                        if puede_avanzar:
-                            datos = {
-                                "cantidad_inicial": op.get("cantidad", 0),
-                                "tiempo_inicio": None,
-                                "tiempo_fin": None,
-                                "tiempo_total": None,
-                                "personas": None
-                            }
-
-                            numero_op = op["numero_op"]
-                            mostrar_formulario = st.checkbox("📝 Registrar datos de etapa", key=f"check_formulario_{numero_op}")
-
-                            if mostrar_formulario:
-                                st.subheader("📊 Registro de Cantidades")
-                                st.info(f"Cantidad inicial: **{datos['cantidad_inicial']}** unidades")
-
-                                mt_utilizada = st.number_input("Cantidad de materia prima utilizada (MT)", min_value=0, key=f"mt_{numero_op}")
-                                merma = st.number_input("Cantidad de merma", min_value=0, key=f"merma_{numero_op}")
-
-                                cantidad_final = mt_utilizada - merma
-                                st.success(f"Cantidad final: **{cantidad_final}** unidades")
-
-                                mostrar_tiempos = st.checkbox("⏱️ Registrar tiempos VSM", key=f"check_tiempos_{numero_op}")
-                                if mostrar_tiempos:
-                                    st.subheader("📈 Tiempos VSM")
-                                    col1, col2, col3 = st.columns(3)
-                                    with col1:
-                                        setup_time = st.number_input("Setup Time (min)", min_value=0, key=f"setup_{numero_op}")
-                                    with col2:
-                                        cycle_time = st.number_input("Cycle Time por unidad (seg)", min_value=0, key=f"cycle_{numero_op}")
-                                    with col3:
-                                        idle_time = st.number_input("Idle Time (min)", min_value=0, key=f"idle_{numero_op}")
-
-                                mostrar_crono = st.checkbox("🕒 Iniciar proceso con cronómetro", key=f"check_crono_{numero_op}")
-                                if mostrar_crono:
-                                    if st.button("▶️ Iniciar proceso", key=f"iniciar_{numero_op}"):
-                                        datos["tiempo_inicio"] = time.time()
-                                        st.success("Proceso iniciado...")
-
-                                    if st.button("⏹ Finalizar proceso", key=f"fin_{numero_op}"):
-                                        datos["tiempo_fin"] = time.time()
-                                        if datos["tiempo_inicio"]:
-                                            tiempo_total = round((datos["tiempo_fin"] - datos["tiempo_inicio"]) / 60, 2)
-                                            datos["tiempo_total"] = tiempo_total
-                                            st.success(f"⏱️ Tiempo total: {tiempo_total} minutos")
-                                        else:
-                                            st.warning("Debes iniciar primero el proceso.")
-
-                                mostrar_personas = st.checkbox("👥 Registrar número de personas", key=f"check_personas_{numero_op}")
-                                if mostrar_personas:
-                                    personas = st.number_input("Número de personas involucradas", min_value=1, key=f"personas_{numero_op}")
-                                    datos["personas"] = personas
-
-                                st.subheader("📄 Resumen de etapa")
-                                st.write(f"- Cantidad inicial: {datos['cantidad_inicial']}")
-                                st.write(f"- MT utilizada: {mt_utilizada}")
-                                st.write(f"- Merma: {merma}")
-                                st.write(f"- Cantidad final: {cantidad_final}")
-                                if mostrar_tiempos:
-                                    st.write(f"- Setup Time: {setup_time} min")
-                                    st.write(f"- Cycle Time: {cycle_time} seg")
-                                    st.write(f"- Idle Time: {idle_time} min")
-                                if datos["tiempo_total"]:
-                                    st.write(f"- Tiempo total proceso: {datos['tiempo_total']} min")
-                                if mostrar_personas:
-                                    st.write(f"- Personas involucradas: {datos['personas']}")
-
-                                if st.button("📤 Enviar a siguiente etapa", key=f"btn_avanzar_{numero_op}"):
-                                    op["estado_actual"] = siguiente_etapa
-                                    op["cantidad"] = cantidad_final
-                                    guardar_ops(ops)
-                                    guardar_trazabilidad({
-                                        "op": numero_op,
-                                        "fecha": datetime.now().isoformat(),
-                                        "usuario": usuario,
-                                        "etapa_anterior": etapa_actual,
-                                        "etapa_nueva": siguiente_etapa,
-                                        "datos_etapa": {
-                                            "mt_utilizada": mt_utilizada,
-                                            "merma": merma,
-                                            "cantidad_final": cantidad_final,
-                                            "setup_time": setup_time if mostrar_tiempos else None,
-                                            "cycle_time": cycle_time if mostrar_tiempos else None,
-                                            "idle_time": idle_time if mostrar_tiempos else None,
-                                            "tiempo_total": datos["tiempo_total"],
-                                            "personas": datos["personas"]
-                                        }
-                                    })
-                                    st.success(f"✅ OP {numero_op} enviada a etapa: {siguiente_etapa}")
-                                    st.rerun()
-                        else:
-                            st.success("✅ Esta OP ha completado todas sus etapas.")
-
-                        st.markdown("</div>", unsafe_allow_html=True)
\ No newline at end of file
+                ops_en_etapa = indice_ops.por_estado(etapa["nombre"])
+                mostrar_encabezado_etapa(etapa, len(ops_en_etapa))
+
+                # La OP abierta se muestra arriba de su columna, fuera de la paginación
+                if op_abierta and indice_ops.obtener(op_abierta)["estado_actual"] == etapa["nombre"]:
+                    ops_en_etapa = [op for op in ops_en_etapa if op["numero_op"] != op_abierta]
+                    mostrar_tarjeta_abierta(op_abierta, usuario)
+
+                for op in paginar(ops_en_etapa, etapa["nombre"]):
+                    mostrar_tarjeta(op, colores)
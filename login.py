@@ -1,12 +1,58 @@
 import streamlit as st
 import sqlite3
+import queue
+import threading
+from contextlib import contextmanager
 import bcrypt
 
 # ---------- BASE DE DATOS ----------
-def init_db():
-    conn = sqlite3.connect('usuarios.db')
-    c = conn.cursor()
-    c.execute('''
+# Conexiones reutilizadas desde un pool (no una por función), el esquema y el
+# usuario por defecto se crean una sola vez por proceso, y los permisos
+# (rol, etapa) se leen de una caché que se invalida al crear, actualizar o
+# eliminar usuarios.
+USUARIOS_DB = 'usuarios.db'
+POOL_MAX = 4
+
+_pool = queue.LifoQueue()
+_lock = threading.Lock()
+_inicializada = False
+_permisos = None  # username -> (rol, etapa)
+
+def _nueva_conexion():
+    return sqlite3.connect(USUARIOS_DB, timeout=30, check_same_thread=False)
+
+@contextmanager
+def _conexion():
+    inicializar()
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _nueva_conexion()
+    try:
+        with conn:  # commit al salir, rollback si hubo error
+            yield conn
+    finally:
+        if _pool.qsize() < POOL_MAX:
+            _pool.put(conn)
+        else:
+            conn.close()
+
+def inicializar():
+    global _inicializada
+    if _inicializada:
+        return
+    with _lock:
+        if _inicializada:
+            return
+        conn = _nueva_conexion()
+        with conn:
+            init_db(conn)
+            crear_usuario_por_defecto(conn)
+        _pool.put(conn)
+        _inicializada = True
+
+def init_db(conn):
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS usuarios (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE,
@@ -15,44 +61,43 @@ def init_db():
             etapa TEXT
         )
     ''')
-    conn.commit()
-    conn.close()
-
-def crear_usuario_por_defecto():
-    conn = sqlite3.connect('usuarios.db')
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM usuarios")
-    if c.fetchone()[0] == 0:
+
+def crear_usuario_por_defecto(conn):
+    if conn.execute("SELECT COUNT(*) FROM usuarios").fetchone()[0] == 0:
         hashed_password = bcrypt.hashpw("admin123".encode(), bcrypt.gensalt())
-        c.execute("INSERT INTO usuarios (username, password, rol, etapa) VALUES (?, ?, ?, ?)",
-                  ("admin", hashed_password, "administrador", ""))
-        conn.commit()
+        conn.execute("INSERT INTO usuarios (username, password, rol, etapa) VALUES (?, ?, ?, ?)",
+                     ("admin", hashed_password, "administrador", ""))
         print("🔐 Usuario por defecto creado: admin / admin123")
-    conn.close()
-
 
+def _invalidar_permisos():
+    global _permisos
+    _permisos = None
 
+def obtener_permisos(username):
+    # (rol, etapa) del usuario desde la caché; ("", "") si no existe
+    global _permisos
+    permisos = _permisos
+    if permisos is None:
+        with _conexion() as conn:
+            filas = conn.execute("SELECT username, rol, etapa FROM usuarios").fetchall()
+        permisos = _permisos = {u: (rol or "", etapa or "") for u, rol, etapa in filas}
+    return permisos.get(username, ("", ""))
 
 def crear_usuario(username, password, rol, etapa):
-    conn = sqlite3.connect('usuarios.db')
-    c = conn.cursor()
     hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
     try:
-        c.execute("INSERT INTO usuarios (username, password, rol, etapa) VALUES (?, ?, ?, ?)", 
-                  (username, hashed_password, rol, etapa))
-        conn.commit()
+        with _conexion() as conn:
+            conn.execute("INSERT INTO usuarios (username, password, rol, etapa) VALUES (?, ?, ?, ?)",
+                         (username, hashed_password, rol, etapa))
         return True
     except sqlite3.IntegrityError:
         return False
     finally:
-        conn.close()
+        _invalidar_permisos()
 
 def verificar_usuario(username, password):
-    conn = sqlite3.connect('usuarios.db')
-    c = conn.cursor()
-    c.execute("SELECT password, rol, etapa FROM usuarios WHERE username=?", (username,))
-    result = c.fetchone()
-    conn.close()
+    with _conexion() as conn:
+        result = conn.execute("SELECT password, rol, etapa FROM usuarios WHERE username=?", (username,)).fetchone()
     if result:
         hashed_password, rol, etapa = result
         if bcrypt.checkpw(password.encode(), hashed_password):
@@ -60,32 +105,24 @@ def verificar_usuario(username, password):
     return None, None
 
 def obtener_usuarios():
-    conn = sqlite3.connect('usuarios.db')
-    c = conn.cursor()
-    c.execute("SELECT id, username, rol, etapa FROM usuarios")
-    users = c.fetchall()
-    conn.close()
-    return users
+    with _conexion() as conn:
+        return conn.execute("SELECT id, username, rol, etapa FROM usuarios").fetchall()
 
 def actualizar_usuario(user_id, password=None, rol=None, etapa=None):
-    conn = sqlite3.connect('usuarios.db')
-    c = conn.cursor()
-    if password:
-        hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-        c.execute("UPDATE usuarios SET password=? WHERE id=?", (hashed_password, user_id))
-    if rol:
-        c.execute("UPDATE usuarios SET rol=? WHERE id=?", (rol, user_id))
-    if etapa:
-        c.execute("UPDATE usuarios SET etapa=? WHERE id=?", (etapa, user_id))
-    conn.commit()
-    conn.close()
+    with _conexion() as conn:
+        if password:
+            hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+            conn.execute("UPDATE usuarios SET password=? WHERE id=?", (hashed_password, user_id))
+        if rol:
+            conn.execute("UPDATE usuarios SET rol=? WHERE id=?", (rol, user_id))
+        if etapa:
+            conn.execute("UPDATE usuarios SET etapa=? WHERE id=?", (etapa, user_id))
+    _invalidar_permisos()
 
 def eliminar_usuario(user_id):
-    conn = sqlite3.connect('usuarios.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM usuarios WHERE id=?", (user_id,))
-    conn.commit()
-    conn.close()
+    with _conexion() as conn:
+        conn.execute("DELETE FROM usuarios WHERE id=?", (user_id,))
+    _invalidar_permisos()
 # Fuera de login_modulo()
 
 def registrar_usuario():
@@ -132,8 +169,7 @@ def login_modulo():
     st.markdown("<h3 style='text-align: center; color: #007acc;'>🚀 Mejora continua al alcance de tu pantalla 💻</h3>", unsafe_allow_html=True)
 
 
-    init_db()  # Inicializa la base de datos si no existe
-    crear_usuario_por_defecto()  # Crea admin/admin123 si no hay usuarios
+    inicializar()  # Crea la base y admin/admin123 la primera vez (una vez por proceso)
 
     # Crear una columna centralizada y con ancho fijo
     cols = st.columns([1, 2, 1])
@@ -0,0 +1,58 @@
+# ------------------ Resolución de archivos de medios ------------------ #
+# Índice nombre de archivo -> ruta para todas las carpetas de medios
+# (evidencias e imágenes de OP). Se arma una vez por proceso listando las
+# carpetas y se actualiza al guardar un archivo nuevo, así los módulos no
+# hacen un os.path.exists por fila en cada render.
+#
+# Las rutas guardadas en los datos pueden venir de Windows
+# ("files/imagenes_op\\001.png"): solo se usa el nombre del archivo.
+import os
+import threading
+
+DIRECTORIOS = ("evidencias", os.path.join("files", "imagenes_op"))
+
+_lock = threading.Lock()
+_indice = None  # nombre -> ruta
+
+def _nombre(ruta):
+    return os.path.basename(str(ruta).replace("\\", "/"))
+
+def _construir():
+    indice = {}
+    for directorio in DIRECTORIOS:
+        if not os.path.isdir(directorio):
+            continue
+        with os.scandir(directorio) as entradas:
+            for entrada in entradas:
+                if entrada.is_file() and not entrada.name.endswith(".tmp"):
+                    indice[entrada.name] = entrada.path
+    return indice
+
+def _obtener_indice():
+    global _indice
+    if _indice is None:
+        with _lock:
+            if _indice is None:
+                _indice = _construir()
+    return _indice
+
+def registrar(ruta):
+    # Agrega un archivo recién guardado al índice
+    indice = _obtener_indice()
+    with _lock:
+        indice[_nombre(ruta)] = str(ruta)
+
+def resolver(nombre_o_ruta):
+    # Ruta en disco del archivo, o None si no existe en ninguna carpeta de medios
+    if not nombre_o_ruta:
+        return None
+    nombre = _nombre(nombre_o_ruta)
+    ruta = _obtener_indice().get(nombre)
+    if ruta is None:
+        # Puede haberlo guardado otro proceso: se busca una vez y se recuerda
+        for directorio in DIRECTORIOS:
+            candidata = os.path.join(directorio, nombre)
+            if os.path.isfile(candidata):
+                registrar(candidata)
+                return candidata
+    return ruta
@@ -0,0 +1,111 @@
+# ------------------ Caché de miniaturas y versiones reducidas ------------------ #
+# Genera (una vez) versiones livianas de las imágenes de OP y de las fotos de
+# evidencia para no enviar el PNG de 150 DPI o la foto original del celular a
+# cada tablet. Las versiones se nombran por el SHA-256 del contenido original,
+# así un mismo archivo se procesa una sola vez aunque esté repetido.
+# La carpeta tiene un presupuesto de tamaño: al superarlo se borran las
+# versiones usadas hace más tiempo (LRU según mtime).
+import hashlib
+import os
+import threading
+import time
+import archivos
+from PIL import Image, ImageOps, features
+
+CACHE_DIR = os.path.join("files", "cache_imagenes")
+PRESUPUESTO_BYTES = 200 * 1024 * 1024
+TOQUE_MIN_SEGUNDOS = 3600  # no se actualiza el mtime de una versión más de una vez por hora
+
+# Contexto de visualización -> (lado máximo en px, calidad)
+RENDICIONES = {
+    "mini": (320, 70),   # tarjetas, listas de evidencia
+    "media": (1280, 80), # vista de detalle
+}
+
+FORMATO = "WEBP" if features.check("webp") else "JPEG"
+EXTENSION = ".webp" if FORMATO == "WEBP" else ".jpg"
+
+_lock = threading.Lock()
+_hashes = {}  # (ruta, mtime_ns, tamaño) -> sha256
+_tamano_total = None
+
+def _hash_archivo(ruta):
+    info = os.stat(ruta)
+    clave = (os.path.abspath(ruta), info.st_mtime_ns, info.st_size)
+    sha = _hashes.get(clave)
+    if sha is None:
+        h = hashlib.sha256()
+        with open(ruta, "rb") as f:
+            for bloque in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(bloque)
+        sha = h.hexdigest()
+        _hashes[clave] = sha
+    return sha
+
+def _ruta_cache(sha, tipo):
+    return os.path.join(CACHE_DIR, sha[:2], f"{sha}_{tipo}{EXTENSION}")
+
+def _generar(origen, destino, lado, calidad):
+    with Image.open(origen) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)  # fotos de celular giradas
+        imagen.thumbnail((lado, lado))
+        if FORMATO == "JPEG" and imagen.mode not in ("RGB", "L"):
+            imagen = imagen.convert("RGB")
+        elif imagen.mode not in ("RGB", "RGBA", "L", "LA"):
+            imagen = imagen.convert("RGBA")
+        with archivos.escribir_atomico(destino) as f:
+            imagen.save(f, FORMATO, quality=calidad)
+
+def _archivos_cache():
+    for raiz, _, nombres in os.walk(CACHE_DIR):
+        for nombre in nombres:
+            if nombre.endswith(EXTENSION):
+                yield os.path.join(raiz, nombre)
+
+def _registrar_tamano(delta):
+    global _tamano_total
+    with _lock:
+        if _tamano_total is None:
+            _tamano_total = sum(os.path.getsize(r) for r in _archivos_cache())
+        else:
+            _tamano_total += delta
+        excedido = _tamano_total > PRESUPUESTO_BYTES
+    if excedido:
+        desalojar()
+
+def desalojar(presupuesto=PRESUPUESTO_BYTES):
+    # Borra las versiones menos usadas hasta quedar en el 80 % del presupuesto
+    global _tamano_total
+    archivos = []
+    for ruta in _archivos_cache():
+        info = os.stat(ruta)
+        archivos.append((info.st_mtime, info.st_size, ruta))
+    total = sum(tamano for _, tamano, _ in archivos)
+    for _, tamano, ruta in sorted(archivos):
+        if total <= presupuesto * 0.8:
+            break
+        try:
+            os.remove(ruta)
+            total -= tamano
+        except FileNotFoundError:
+            pass
+    with _lock:
+        _tamano_total = total
+
+def rendicion(ruta, tipo="mini"):
+    # Ruta de la versión reducida de la imagen para el contexto indicado. Si la
+    # imagen no se puede procesar, devuelve la original.
+    ruta = str(ruta)
+    try:
+        sha = _hash_archivo(ruta)
+        destino = _ruta_cache(sha, tipo)
+        if os.path.exists(destino):
+            if time.time() - os.path.getmtime(destino) > TOQUE_MIN_SEGUNDOS:
+                os.utime(destino)
+            return destino
+        lado, calidad = RENDICIONES[tipo]
+        _generar(ruta, destino, lado, calidad)
+        _registrar_tamano(os.path.getsize(destino))
+        return destino
+    except (OSError, ValueError):
+        return ruta
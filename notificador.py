@@ -0,0 +1,20 @@
+# ------------------ Aviso de cambios entre sesiones ------------------ #
+# Bus en memoria del proceso (todas las sesiones de Streamlit comparten el
+# proceso): cada canal tiene un contador que datos.py incrementa después de
+# cada escritura. Las sesiones comparan el contador con el último que vieron
+# y solo releen/redibujan cuando cambió, sin consultar el disco.
+#
+# Canales: los nombres de la caché de datos.py ("ops", "alertas_pendientes",
+# "trazabilidad", "rollups").
+import threading
+
+_lock = threading.Lock()
+_versiones = {}  # canal -> contador
+
+def publicar(*canales):
+    with _lock:
+        for canal in canales:
+            _versiones[canal] = _versiones.get(canal, 0) + 1
+
+def version(canal):
+    return _versiones.get(canal, 0)
@@ -0,0 +1,10 @@
+# ------------------ Valores numéricos de la configuración ------------------ #
+# Los campos numéricos de etapas llegan como int, float, texto o NaN (celdas
+# vacías del editor de etapas): se leen siempre a través de numero().
+
+def numero(valor, por_defecto=0.0):
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return por_defecto
+    return por_defecto if valor != valor else valor  # NaN de celdas vacías
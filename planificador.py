@@ -0,0 +1,176 @@
+# ------------------ Planificación a capacidad finita ------------------ #
+# Programa todas las OPs abiertas sobre la capacidad de cada etapa
+# (configuración de etapas):
+#   - duración de una OP en la etapa: preparación + tiempo estimado +
+#     mantenimiento (min), ajustada por eficiencia y personas asignadas; en la
+#     etapa actual solo lo que falta (se descuenta la estadía, como en el semáforo)
+#   - jornada de la etapa: horas_trabajo por día laborable desde JORNADA_INICIO
+#   - cada etapa atiende una OP a la vez y nunca queda ociosa con OPs
+#     esperando: al liberarse toma, entre las que ya llegaron a ella, la de
+#     fecha de entrega más próxima (despacho en orden de tiempo)
+# El resultado por OP es el inicio y fin planificado de cada etapa pendiente,
+# la fecha de fin estimada y si está en riesgo de no llegar a fecha_entrega.
+# Costo: OPs × etapas pendientes × log (más los días que ocupa cada tramo).
+import heapq
+from datetime import datetime, date, time as hora, timedelta
+from numeros import numero
+
+JORNADA_INICIO = hora(8, 0)
+HORAS_POR_DEFECTO = 8                  # etapas sin horas_trabajo configuradas
+HORAS_MAX = 24 - JORNADA_INICIO.hour   # la jornada no cruza la medianoche
+DIAS_LABORABLES = (0, 1, 2, 3, 4, 5)   # lunes a sábado
+PASO_PLAN_MIN = 15  # el "ahora" del plan se redondea: replanificar sin cambios no reescribe las OPs
+
+def capacidad(etapa):
+    # (horas de jornada, minutos de reloj que ocupa una OP en la etapa)
+    horas = min(numero(etapa.get("horas_trabajo")) or HORAS_POR_DEFECTO, HORAS_MAX)
+    trabajo = sum(numero(etapa.get(c)) for c in ("tiempo_preparacion", "tiempo_estimado", "tiempo_mantenimiento"))
+    eficiencia = numero(etapa.get("eficiencia_esperada"), 100) or 100
+    personas = numero(etapa.get("personas_asignadas"), 1) or 1
+    return horas, trabajo * 100 / eficiencia / personas
+
+# ------------------ Calendario ------------------ #
+def _apertura(dia):
+    return datetime.combine(dia, JORNADA_INICIO)
+
+def _a_jornada(t, horas):
+    # Primer instante laborable de la etapa desde t
+    while True:
+        apertura = _apertura(t.date())
+        if t.weekday() in DIAS_LABORABLES:
+            if t < apertura:
+                return apertura
+            if t < apertura + timedelta(hours=horas):
+                return t
+        t = _apertura(t.date() + timedelta(days=1))
+
+def _sumar_laborable(t, minutos, horas):
+    # Fin de un trabajo de `minutos` que empieza en t, repartido en jornadas
+    while True:
+        t = _a_jornada(t, horas)
+        cierre = _apertura(t.date()) + timedelta(hours=horas)
+        disponible = (cierre - t).total_seconds() / 60
+        if minutos <= disponible:
+            return t + timedelta(minutes=minutos)
+        minutos -= disponible
+        t = cierre
+
+def _redondear(t):
+    t = t.replace(second=0, microsecond=0)
+    return t + timedelta(minutes=-t.minute % PASO_PLAN_MIN)
+
+def _iso(t):
+    return t.isoformat(timespec="minutes")
+
+# ------------------ Plan ------------------ #
+def etapas_pendientes(op):
+    # Etapa actual y siguientes; [] si la OP ya está en su última etapa
+    etapas = op.get("etapas") or []
+    if op.get("estado_actual") in etapas:
+        etapas = etapas[etapas.index(op["estado_actual"]):]
+    return etapas if len(etapas) > 1 else []
+
+def inicio_etapa_actual(op):
+    historial = op.get("historial") or []
+    if historial and historial[-1].get("fin") is None and historial[-1].get("etapa") == op.get("estado_actual"):
+        return historial[-1].get("inicio")
+    return None
+
+def estadia_actual(op, ahora):
+    # Minutos de reloj que la OP lleva en su etapa actual (como en semaforo.py)
+    try:
+        ingreso = datetime.fromisoformat(inicio_etapa_actual(op))
+    except (TypeError, ValueError):
+        return 0.0
+    return max((ahora - ingreso).total_seconds() / 60, 0.0)
+
+def _entrega(op):
+    try:
+        return date.fromisoformat(op.get("fecha_entrega"))
+    except (TypeError, ValueError):
+        return None
+
+# Tipos de evento: a un mismo instante se liberan las etapas, llegan las OPs
+# y recién entonces se despacha (así compiten todas las que llegaron)
+_LIBERACION, _LLEGADA, _DESPACHO = 0, 1, 2
+
+def planificar(ops, etapas, ahora=None):
+    # Devuelve numero_op -> {planificacion, fecha_fin_estimada, en_riesgo, dias_restantes}
+    # para las OPs abiertas.
+    ahora = _redondear(ahora or datetime.now())
+    config = {e.get("nombre"): capacidad(e) for e in etapas}
+    # La última etapa (p. ej. "OP Terminados") es el destino: no se planifica
+    rutas = []
+    for op in ops:
+        pendientes = etapas_pendientes(op)
+        if pendientes:
+            rutas.append((op, [n for n in pendientes[:-1] if n in config]))  # sin etapas borradas
+
+    # Lo ya trabajado en la etapa actual se descuenta de su duración
+    estadias = [estadia_actual(op, ahora) for op, _ in rutas]
+    planes = [{} for _ in rutas]
+    fin_op = [ahora] * len(rutas)
+    espera = {}      # etapa -> heap de (prioridad, índice de OP, posición en su ruta)
+    ocupada = set()  # etapas con una OP en proceso
+    eventos = []     # heap de (momento, tipo, orden, datos)
+    contador = [0]
+
+    def agendar(t, tipo, datos):
+        contador[0] += 1
+        heapq.heappush(eventos, (t, tipo, contador[0], datos))
+
+    def llegar(t, i, k):
+        # La OP i queda lista para la etapa k de su ruta en t (o terminó)
+        if k == len(rutas[i][1]):
+            fin_op[i] = t
+        else:
+            agendar(t, _LLEGADA, (i, k))
+
+    for i in range(len(rutas)):
+        llegar(ahora, i, 0)
+
+    while eventos:
+        t, tipo, _, datos = heapq.heappop(eventos)
+        if tipo == _LIBERACION:
+            ocupada.discard(datos)
+            agendar(t, _DESPACHO, datos)
+        elif tipo == _LLEGADA:
+            i, k = datos
+            op, ruta = rutas[i]
+            prioridad = (op.get("fecha_entrega") or "9999-12-31", inicio_etapa_actual(op) or "", op["numero_op"])
+            heapq.heappush(espera.setdefault(ruta[k], []), (prioridad, i, k))
+            agendar(t, _DESPACHO, ruta[k])
+        elif datos not in ocupada and espera.get(datos):
+            # La etapa libre toma la OP en espera de entrega más próxima
+            _, i, k = heapq.heappop(espera[datos])
+            horas, minutos = config[datos]
+            op, ruta = rutas[i]
+            if k == 0 and datos == op.get("estado_actual"):
+                minutos = max(minutos - estadias[i], 0)
+            inicio = _a_jornada(t, horas) if minutos else t
+            fin = _sumar_laborable(inicio, minutos, horas) if minutos else inicio
+            planes[i][datos] = {"inicio": _iso(inicio), "fin": _iso(fin)}
+            ocupada.add(datos)
+            agendar(fin, _LIBERACION, datos)
+            llegar(fin, i, k + 1)
+
+    resultado = {}
+    for i, (op, ruta) in enumerate(rutas):
+        plan = planes[i]
+        entrega = _entrega(op)
+        resultado[op["numero_op"]] = {
+            "planificacion": plan,
+            "fecha_fin_estimada": _iso(fin_op[i]),
+            "en_riesgo": entrega is not None and fin_op[i].date() > entrega,
+            "dias_restantes": (entrega - ahora.date()).days if entrega else op.get("dias_restantes"),
+        }
+    return resultado
+
+def cambios(ops, etapas, ahora=None):
+    # Solo las OPs cuyo plan difiere del guardado: lo único que hay que escribir
+    planes = planificar(ops, etapas, ahora)
+    por_numero = {op["numero_op"]: op for op in ops}
+    return {
+        numero: plan for numero, plan in planes.items()
+        if any(por_numero[numero].get(campo) != valor for campo, valor in plan.items())
+    }
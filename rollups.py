@@ -0,0 +1,141 @@
+# ------------------ Agregados incrementales de KPIs ------------------ #
+# Por cada evento con datos_etapa o tiempo de estadía se actualizan contadores por etapa, cliente
+# y producto, separados por día: conteo, suma, mínimo, máximo y un histograma
+# logarítmico para estimar percentiles. Los tableros leen estos agregados
+# (O(etapas × días)) en lugar de recorrer todos los eventos.
+#
+# Las funciones reciben una conexión abierta: almacenamiento.py las llama
+# dentro de la misma transacción que registra el cambio de la OP.
+import math
+
+METRICAS = (
+    "tiempo_total", "setup_time", "cycle_time", "idle_time", "merma", "mt_utilizada",
+    "cantidad_final", "personas", "tiempo_estadia_min",
+)
+DIMENSIONES = ("etapa", "cliente", "producto")
+
+# Resolución del histograma: cubetas de ~5 % (log1p(valor) * 20)
+CUBETAS_POR_UNIDAD_LOG = 20
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    dimension TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    dia TEXT NOT NULL,
+    metrica TEXT NOT NULL,
+    conteo INTEGER NOT NULL,
+    suma REAL NOT NULL,
+    minimo REAL NOT NULL,
+    maximo REAL NOT NULL,
+    PRIMARY KEY (dimension, metrica, clave, dia)
+);
+CREATE TABLE IF NOT EXISTS rollups_histograma (
+    dimension TEXT NOT NULL,
+    clave TEXT NOT NULL,
+    dia TEXT NOT NULL,
+    metrica TEXT NOT NULL,
+    cubeta INTEGER NOT NULL,
+    conteo INTEGER NOT NULL,
+    PRIMARY KEY (dimension, metrica, clave, dia, cubeta)
+);
+"""
+
+def _cubeta(valor):
+    return int(round(math.log1p(max(valor, 0)) * CUBETAS_POR_UNIDAD_LOG))
+
+def _valor_cubeta(cubeta):
+    return math.expm1(cubeta / CUBETAS_POR_UNIDAD_LOG)
+
+def _valores(evento):
+    datos_etapa = evento.get("datos_etapa") or {}
+    valores = {}
+    for metrica in METRICAS:
+        # tiempo_estadia_min va en el evento (lo calcula almacenamiento), el resto en datos_etapa
+        valor = datos_etapa.get(metrica, evento.get(metrica))
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool) and not math.isnan(valor):
+            valores[metrica] = float(valor)
+    return valores
+
+def actualizar(conn, evento, cliente=None, producto=None):
+    # Los datos de etapa se registran en la etapa que se está cerrando
+    valores = _valores(evento)
+    if not valores:
+        return
+    dia = (evento.get("fecha") or "")[:10]
+    claves = {
+        "etapa": evento.get("etapa_anterior") or "-",
+        "cliente": cliente or "-",
+        "producto": producto or "-",
+    }
+    filas = []
+    filas_histograma = []
+    for dimension, clave in claves.items():
+        for metrica, valor in valores.items():
+            filas.append((dimension, clave, dia, metrica, valor, valor, valor))
+            filas_histograma.append((dimension, clave, dia, metrica, _cubeta(valor)))
+
+    conn.executemany(
+        "INSERT INTO rollups (dimension, clave, dia, metrica, conteo, suma, minimo, maximo) "
+        "VALUES (?, ?, ?, ?, 1, ?, ?, ?) "
+        "ON CONFLICT (dimension, metrica, clave, dia) DO UPDATE SET "
+        "conteo = conteo + 1, suma = suma + excluded.suma, "
+        "minimo = min(minimo, excluded.minimo), maximo = max(maximo, excluded.maximo)",
+        filas,
+    )
+    conn.executemany(
+        "INSERT INTO rollups_histograma (dimension, clave, dia, metrica, cubeta, conteo) "
+        "VALUES (?, ?, ?, ?, ?, 1) "
+        "ON CONFLICT (dimension, metrica, clave, dia, cubeta) DO UPDATE SET conteo = conteo + 1",
+        filas_histograma,
+    )
+
+def reconstruir(conn, eventos, info_ops):
+    # Recalcula todo desde la bitácora. info_ops: numero_op -> (cliente, producto)
+    conn.execute("DELETE FROM rollups")
+    conn.execute("DELETE FROM rollups_histograma")
+    for evento in eventos:
+        cliente, producto = info_ops.get(evento.get("op"), (None, None))
+        actualizar(conn, evento, cliente, producto)
+
+def _percentil(histograma, total, p):
+    objetivo = p / 100 * total
+    acumulado = 0
+    for cubeta, conteo in histograma:
+        acumulado += conteo
+        if acumulado >= objetivo:
+            return _valor_cubeta(cubeta)
+    return None
+
+def consultar(conn, dimension, metrica, desde=None, hasta=None, percentiles=(50, 90)):
+    # Agregado por clave en el rango de días [desde, hasta] (fechas ISO o None)
+    filtro = "dimension=? AND metrica=? AND dia >= ? AND dia <= ?"
+    parametros = (dimension, metrica, desde or "", hasta or "9999-12-31")
+
+    resumen = {}
+    for clave, conteo, suma, minimo, maximo, dias in conn.execute(
+        f"SELECT clave, SUM(conteo), SUM(suma), MIN(minimo), MAX(maximo), COUNT(DISTINCT dia) FROM rollups WHERE {filtro} GROUP BY clave",
+        parametros,
+    ):
+        resumen[clave] = {
+            "clave": clave,
+            "conteo": conteo,
+            "dias": dias,
+            "suma": suma,
+            "promedio": suma / conteo if conteo else None,
+            "minimo": minimo,
+            "maximo": maximo,
+        }
+
+    histogramas = {}
+    for clave, cubeta, conteo in conn.execute(
+        f"SELECT clave, cubeta, SUM(conteo) FROM rollups_histograma WHERE {filtro} GROUP BY clave, cubeta ORDER BY clave, cubeta",
+        parametros,
+    ):
+        histogramas.setdefault(clave, []).append((cubeta, conteo))
+
+    for clave, fila in resumen.items():
+        for p in percentiles:
+            valor = _percentil(histogramas.get(clave, []), fila["conteo"], p)
+            # La estimación del histograma se acota a los extremos reales
+            fila[f"p{p}"] = min(max(valor, fila["minimo"]), fila["maximo"]) if valor is not None else None
+    return list(resumen.values())
@@ -0,0 +1,82 @@
+# ------------------ Semáforo de atraso de OPs ------------------ #
+# Color automático (verde / amarillo / rojo) de todas las OPs abiertas, en
+# operaciones vectorizadas sobre una tabla OP × etapa pendiente:
+#   - trabajo restante: minutos de las etapas pendientes (capacidad de
+#     planificador.py) menos lo ya transcurrido en la etapa actual, en días
+#     de jornada de cada etapa
+#   - holgura: días laborables hasta fecha_entrega - días de trabajo restante
+#   - estadía: tiempo en estado_actual contra el tiempo estimado de la etapa
+# Rojo: sin holgura, plan en riesgo o estadía > FACTOR_ROJO_ESTADIA × estimado.
+# Amarillo: holgura < MARGEN_AMARILLO_DIAS o estadía mayor que el estimado.
+# El color manual de una alerta pendiente (color_alerta) nunca se rebaja.
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import planificador
+
+COLORES = ("green", "yellow", "red")
+NIVELES = {"green": 0, "yellow": 1, "orange": 1, "red": 2}  # "orange": alertas manuales
+MARGEN_AMARILLO_DIAS = 2
+FACTOR_ROJO_ESTADIA = 2.0
+PASO_MIN = planificador.PASO_PLAN_MIN  # la estadía avanza con el reloj: se reevalúa cada paso
+_MASCARA_LABORABLE = "".join("1" if d in planificador.DIAS_LABORABLES else "0" for d in range(7))
+
+def evaluar(ops, etapas, ahora=None):
+    # Devuelve numero_op -> color para las OPs abiertas
+    ahora = ahora or datetime.now()
+    abiertas = [(op, planificador.etapas_pendientes(op)) for op in ops]
+    abiertas = [(op, pendientes) for op, pendientes in abiertas if pendientes]
+    if not abiertas:
+        return {}
+
+    tabla_ops = pd.DataFrame({
+        "numero_op": [op["numero_op"] for op, _ in abiertas],
+        "fecha_entrega": pd.to_datetime([op.get("fecha_entrega") for op, _ in abiertas], errors="coerce"),
+        "ingreso": pd.to_datetime([planificador.inicio_etapa_actual(op) for op, _ in abiertas], errors="coerce"),
+        "en_riesgo": [bool(op.get("en_riesgo")) for op, _ in abiertas],
+        "nivel_manual": [NIVELES.get(op.get("color_alerta"), 0) for op, _ in abiertas],
+    }).set_index("numero_op")
+
+    # Una fila por OP y etapa pendiente (sin la etapa final, que es el destino)
+    pendientes = pd.DataFrame(
+        [(op["numero_op"], etapa, i == 0) for op, etapas_op in abiertas for i, etapa in enumerate(etapas_op[:-1])],
+        columns=["numero_op", "etapa", "es_actual"],
+    )
+    capacidades = pd.DataFrame(
+        [(e.get("nombre"), *planificador.capacidad(e)) for e in etapas],
+        columns=["etapa", "horas", "minutos"],
+    ).drop_duplicates("etapa")
+    pendientes = pendientes.merge(capacidades, on="etapa", how="left")
+    pendientes["horas"] = pendientes["horas"].fillna(planificador.HORAS_POR_DEFECTO)
+    pendientes["minutos"] = pendientes["minutos"].fillna(0.0)
+
+    estadia = (pd.Timestamp(ahora) - tabla_ops["ingreso"]).dt.total_seconds().div(60).fillna(0.0).clip(lower=0)
+    actual = pendientes[pendientes["es_actual"]].set_index("numero_op")
+    esperado = actual["minutos"].reindex(tabla_ops.index).fillna(0.0)
+
+    # Lo ya transcurrido en la etapa actual se descuenta de su trabajo
+    restante = pendientes["minutos"].to_numpy().copy()
+    es_actual = pendientes["es_actual"].to_numpy()
+    restante[es_actual] = np.clip(
+        restante[es_actual] - estadia.reindex(pendientes.loc[es_actual, "numero_op"]).to_numpy(), 0, None
+    )
+    pendientes["dias_trabajo"] = restante / (pendientes["horas"].to_numpy() * 60)
+    necesario = pendientes.groupby("numero_op")["dias_trabajo"].sum().reindex(tabla_ops.index).fillna(0.0)
+
+    # Días laborables desde hoy hasta la fecha de entrega inclusive (negativo si ya pasó)
+    entrega = tabla_ops["fecha_entrega"]
+    valida = entrega.notna().to_numpy()
+    disponible = np.full(len(tabla_ops), np.inf)
+    disponible[valida] = np.busday_count(
+        np.datetime64(ahora.date()),
+        (entrega[valida] + timedelta(days=1)).to_numpy().astype("datetime64[D]"),
+        weekmask=_MASCARA_LABORABLE,
+    )
+    holgura = disponible - necesario.to_numpy()
+
+    con_estimado = esperado.to_numpy() > 0
+    estadia = estadia.to_numpy()
+    rojo = (holgura < 0) | tabla_ops["en_riesgo"].to_numpy() | (con_estimado & (estadia > FACTOR_ROJO_ESTADIA * esperado.to_numpy()))
+    amarillo = (holgura < MARGEN_AMARILLO_DIAS) | (con_estimado & (estadia > esperado.to_numpy()))
+    nivel = np.maximum(np.where(rojo, 2, np.where(amarillo, 1, 0)), tabla_ops["nivel_manual"].to_numpy())
+    return dict(zip(tabla_ops.index, np.asarray(COLORES)[nivel].tolist()))
@@ -0,0 +1,95 @@
+# ------------------ Tabla columnar de trazabilidad ------------------ #
+# Vista plana y tipada de la bitácora (datos_etapa ya expandido en columnas).
+# Cada segmento cerrado de la bitácora se materializa una sola vez en un
+# archivo Parquet; solo el segmento activo se aplana en memoria. Así, al
+# agregar eventos no se vuelve a procesar el historial completo y el tablero
+# lee únicamente las columnas que necesita.
+import os
+import pandas as pd
+import archivos
+import bitacora
+import datos
+
+VERSION_ESQUEMA = 2  # 2: tiempo_estadia_min
+SNAPSHOT_DIR = os.path.join(bitacora.BITACORA_DIR, f"parquet_v{VERSION_ESQUEMA}")
+
+# Columna -> tipo. Las de datos_etapa se toman del dict anidado del evento.
+COLUMNAS_EVENTO = {
+    "op": "category",
+    "fecha": "datetime64[ns]",
+    "usuario": "category",
+    "etapa_anterior": "category",
+    "etapa_nueva": "category",
+    "tipo_alerta": "category",
+    "comentario": "string",
+    "foto_nombre": "string",
+    "tiempo_estadia_min": "float64",
+}
+COLUMNAS_ETAPA = {
+    "mt_utilizada": "float64",
+    "merma": "float64",
+    "cantidad_final": "float64",
+    "setup_time": "float64",
+    "cycle_time": "float64",
+    "idle_time": "float64",
+    "tiempo_total": "float64",
+    "personas": "float64",
+}
+COLUMNAS = {**COLUMNAS_EVENTO, **COLUMNAS_ETAPA}
+
+def _tipar(df):
+    for columna, tipo in COLUMNAS.items():
+        if tipo == "datetime64[ns]":
+            df[columna] = pd.to_datetime(df[columna], format="ISO8601", errors="coerce")
+        elif tipo == "float64":
+            df[columna] = pd.to_numeric(df[columna], errors="coerce")
+        else:
+            df[columna] = df[columna].astype(tipo)
+    return df
+
+def aplanar(eventos):
+    filas = []
+    for evento in eventos:
+        fila = {c: evento.get(c) for c in COLUMNAS_EVENTO}
+        datos_etapa = evento.get("datos_etapa") or {}
+        for c in COLUMNAS_ETAPA:
+            fila[c] = datos_etapa.get(c)
+        filas.append(fila)
+    return _tipar(pd.DataFrame(filas, columns=list(COLUMNAS)))
+
+def _ruta_parquet(ruta_segmento):
+    nombre = os.path.splitext(os.path.basename(ruta_segmento))[0]
+    return os.path.join(SNAPSHOT_DIR, nombre + ".parquet")
+
+def materializar(ruta_segmento):
+    # Los segmentos cerrados no cambian: se convierten una vez y se reutilizan
+    ruta = _ruta_parquet(ruta_segmento)
+    if not os.path.exists(ruta):
+        df = aplanar(bitacora.leer_segmento(ruta_segmento))
+        with archivos.escribir_atomico(ruta) as f:
+            df.to_parquet(f, index=False)
+    return ruta
+
+def _cargar(columnas):
+    segmentos = bitacora.listar_segmentos()
+    if not segmentos:
+        return aplanar([])[columnas]
+
+    partes = [pd.read_parquet(materializar(s), columns=columnas) for s in segmentos[:-1]]
+    partes.append(aplanar(bitacora.leer_segmento(segmentos[-1]))[columnas])
+    df = pd.concat(partes, ignore_index=True)
+    # concat de categóricas con categorías distintas devuelve object: se re-tipa
+    for columna in columnas:
+        if COLUMNAS[columna] == "category":
+            df[columna] = df[columna].astype("category")
+    return df
+
+def cargar_tabla(columnas=None):
+    # DataFrame tipado con las columnas pedidas (todas si no se indican),
+    # guardado en la caché compartida hasta que cambie la bitácora.
+    columnas = list(columnas or COLUMNAS)
+    return datos.cargar_con_cache(
+        "trazabilidad:tabla:" + ",".join(columnas),
+        bitacora.listar_segmentos,
+        lambda: _cargar(columnas)
+    )
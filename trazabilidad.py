@@ -1,18 +1,71 @@
 import streamlit as st
 import pandas as pd
-import os
-import json
 import matplotlib.pyplot as plt
+import tabla_trazabilidad
+import rollups
+import miniaturas
+import medios
+from datos import cargar_rollups, cargar_vsm
+
+NOMBRES_DIMENSION = {"etapa": "Etapa", "cliente": "Cliente", "producto": "Producto"}
+
+def cargar_trazabilidad(columnas=None):
+    # Tabla plana y tipada (datos_etapa expandido) desde el snapshot columnar
+    return tabla_trazabilidad.cargar_tabla(columnas)
+
+def mostrar_kpis():
+    # Lee los agregados incrementales (rollups.py), no los eventos
+    st.subheader("📈 KPIs por etapa, cliente y producto")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        dimension = st.selectbox("Agrupar por", list(NOMBRES_DIMENSION), format_func=NOMBRES_DIMENSION.get, key="kpi_dimension")
+    with col2:
+        metrica = st.selectbox("Métrica", rollups.METRICAS, key="kpi_metrica")
+    with col3:
+        rango = st.date_input("Rango de fechas (opcional)", value=(), key="kpi_rango")
+
+    desde = rango[0].isoformat() if len(rango) > 0 else None
+    hasta = rango[1].isoformat() if len(rango) > 1 else desde
+
+    resumen = cargar_rollups(dimension, metrica, desde, hasta)
+    if not resumen:
+        st.info("No hay datos registrados para esta métrica.")
+        return
 
-TRAZABILIDAD_FILE = "data/trazabilidad.json"
-
-def cargar_trazabilidad():
-    if os.path.exists(TRAZABILIDAD_FILE):
-        with open(TRAZABILIDAD_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return pd.DataFrame(data)
-    else:
-        return pd.DataFrame()
+    df = pd.DataFrame(resumen).rename(columns={"clave": NOMBRES_DIMENSION[dimension]})
+    st.dataframe(df.drop(columns=["suma"]).round(2), use_container_width=True, hide_index=True)
+
+COLUMNAS_VSM = {
+    "etapa": "Etapa",
+    "ops": "OPs",
+    "setup_min": "Setup (min)",
+    "ciclo_seg": "Ciclo (seg/u)",
+    "espera_min": "Espera (min)",
+    "proceso_min": "Proceso (min/OP)",
+    "lead_time_min": "Lead time (min/OP)",
+    "takt_min": "Takt (min/u)",
+    "ciclo_efectivo_min": "Ciclo efectivo (min/u)",
+    "carga": "Carga vs takt",
+    "merma_pct": "Merma (%)",
+}
+
+def mostrar_vsm():
+    # Value Stream Map calculado desde los agregados por etapa (vsm.py)
+    st.subheader("🗺️ Value Stream Map")
+    rango = st.date_input("Rango de fechas (opcional)", value=(), key="vsm_rango")
+    desde = rango[0].isoformat() if len(rango) > 0 else None
+    hasta = rango[1].isoformat() if len(rango) > 1 else desde
+
+    resultado = cargar_vsm(desde, hasta)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Lead time total", f"{resultado['lead_time_total_min']:.1f} min")
+    col2.metric("Tiempo de proceso", f"{resultado['tiempo_proceso_total_min']:.1f} min")
+    ratio = resultado["ratio_valor_agregado"]
+    col3.metric("Valor agregado", f"{ratio:.1%}" if ratio is not None else "-")
+    col4.metric("Cuello de botella", resultado["cuello_botella"] or "-")
+
+    df = pd.DataFrame(resultado["etapas"], columns=list(COLUMNAS_VSM)).rename(columns=COLUMNAS_VSM)
+    st.dataframe(df.round(2), use_container_width=True, hide_index=True)
 
 def mostrar_trazabilidad():
     st.title("🔍 Trazabilidad de Órdenes de Producción")
@@ -41,21 +94,21 @@ def mostrar_trazabilidad():
     fotos_disponibles = df_op.dropna(subset=["foto_nombre"])
 
     for idx, row in fotos_disponibles.iterrows():
-        ruta_foto = f"data/fotos/{row['foto_nombre']}"
-        if os.path.exists(ruta_foto):
+        ruta_foto = medios.resolver(row["foto_nombre"])
+        if ruta_foto:
             st.markdown(f"**Etapa:** {row['etapa_nueva']} — **Comentario:** {row['comentario']}")
-            st.image(ruta_foto, width=200)
+            st.image(miniaturas.rendicion(ruta_foto, "mini"), width=200)
         else:
             st.warning(f"Foto no encontrada: {row['foto_nombre']}")
 
-    # Mostrar tiempos de estadía por etapa
-    if "tiempo_estadia_min" in df_op.columns:
+    # Tiempo de estadía precalculado al cambiar de etapa (de la etapa que se deja)
+    tiempos = df_op[["etapa_anterior", "tiempo_estadia_min"]].dropna()
+    if not tiempos.empty:
         st.subheader("⏱️ Tiempo de estadía por etapa (minutos)")
-        tiempos = df_op[["etapa_nueva", "tiempo_estadia_min"]].dropna()
         st.dataframe(tiempos)
 
         fig2, ax2 = plt.subplots()
-        ax2.bar(tiempos["etapa_nueva"], tiempos["tiempo_estadia_min"], color="orange")
+        ax2.bar(tiempos["etapa_anterior"].astype(str), tiempos["tiempo_estadia_min"], color="orange")
         ax2.set_ylabel("Minutos")
         ax2.set_title("Tiempo de Estadía por Etapa")
         ax2.tick_params(axis='x', rotation=45)
@@ -66,28 +119,27 @@ def mostrar_trazabilidad():
 
 
 
-    # Normalizar columna datos_etapa
-    if 'datos_etapa' in df_trazabilidad.columns:
-        datos_etapa_df = pd.json_normalize(df_trazabilidad['datos_etapa'])
-        df_expandido = pd.concat([df_trazabilidad.drop(columns=['datos_etapa']), datos_etapa_df], axis=1)
-
-        # Asegurar tipo datetime
-        df_expandido['fecha'] = pd.to_datetime(df_expandido['fecha'], errors='coerce')
+    # Promedio por etapa, vectorizado sobre solo las dos columnas necesarias
+    df_tiempos = cargar_trazabilidad(["etapa_nueva", "tiempo_total"])
+    tiempos_por_etapa = (
+        df_tiempos.groupby("etapa_nueva", observed=True)["tiempo_total"]
+        .mean()
+        .dropna()
+        .reset_index()
+    )
 
-        # Verificar que 'etapa_nueva' y 'tiempo_total' existan
-        if 'etapa_nueva' in df_expandido.columns and 'tiempo_total' in df_expandido.columns:
-            tiempos_por_etapa = df_expandido.groupby('etapa_nueva')['tiempo_total'].mean().reset_index()
-
-            # Graficar
-            st.subheader("⏱️ Tiempo promedio por etapa")
-            fig, ax = plt.subplots()
-            ax.bar(tiempos_por_etapa['etapa_nueva'], tiempos_por_etapa['tiempo_total'], color='skyblue')
-            ax.set_xlabel("Etapa")
-            ax.set_ylabel("Tiempo Promedio (minutos)")
-            ax.set_title("Tiempo Promedio por Etapa")
-            ax.tick_params(axis='x', rotation=45)
-            st.pyplot(fig)
-        else:
-            st.warning("Faltan columnas necesarias para graficar.")
+    if not tiempos_por_etapa.empty:
+        # Graficar
+        st.subheader("⏱️ Tiempo promedio por etapa")
+        fig, ax = plt.subplots()
+        ax.bar(tiempos_por_etapa['etapa_nueva'].astype(str), tiempos_por_etapa['tiempo_total'], color='skyblue')
+        ax.set_xlabel("Etapa")
+        ax.set_ylabel("Tiempo Promedio (minutos)")
+        ax.set_title("Tiempo Promedio por Etapa")
+        ax.tick_params(axis='x', rotation=45)
+        st.pyplot(fig)
     else:
-        st.warning("No se encuentra la columna 'datos_etapa'.")
+        st.warning("Aún no hay tiempos registrados para graficar.")
+
+    mostrar_kpis()
+    mostrar_vsm()
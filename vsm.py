@@ -0,0 +1,90 @@
+# ------------------ Value Stream Map ------------------ #
+# Métricas VSM por etapa a partir de los agregados incrementales de rollups.py
+# (dimensión "etapa") y de la configuración de etapas:
+#   - tiempo de proceso (valor agregado) y lead time por OP en cada etapa
+#   - takt time: tiempo disponible diario / demanda diaria de la etapa
+#   - carga: tiempo de ciclo efectivo / takt (> 1: la etapa no alcanza el ritmo)
+#   - lead time total, ratio de valor agregado y cuello de botella
+# El cálculo recorre solo etapas × métricas: el costo no crece con los eventos.
+from numeros import numero
+
+# Métricas de rollups que usa el VSM
+METRICAS = ("setup_time", "cycle_time", "idle_time", "tiempo_total", "tiempo_estadia_min",
+            "merma", "mt_utilizada", "cantidad_final", "personas")
+
+def _promedio(resumenes, metrica, etapa):
+    fila = resumenes.get(metrica, {}).get(etapa)
+    return fila["promedio"] if fila else None
+
+def _fila(resumenes, metrica, etapa):
+    return resumenes.get(metrica, {}).get(etapa)
+
+def calcular(etapas, resumenes):
+    # etapas: configuración (cargar_etapas). resumenes: metrica -> lista de
+    # rollups.consultar("etapa", metrica, ...). Devuelve un dict con las filas
+    # por etapa (en el orden del flujo) y los totales.
+    resumenes = {m: {f["clave"]: f for f in filas} for m, filas in resumenes.items()}
+    filas = []
+    for etapa in etapas:
+        nombre = etapa.get("nombre")
+        cantidad = _fila(resumenes, "cantidad_final", nombre)
+        setup = _promedio(resumenes, "setup_time", nombre)           # min por OP
+        ciclo_seg = _promedio(resumenes, "cycle_time", nombre)       # seg por unidad
+        espera = _promedio(resumenes, "idle_time", nombre)           # min por OP
+        medido = _promedio(resumenes, "tiempo_total", nombre)        # min por OP (cronómetro)
+        estadia = _promedio(resumenes, "tiempo_estadia_min", nombre) # min por OP en la etapa
+        unidades_op = cantidad["promedio"] if cantidad else None
+
+        # Tiempo de proceso: el medido; si no hay, setup + ciclo × unidades
+        proceso = medido
+        if proceso is None and (setup is not None or ciclo_seg is not None):
+            proceso = (setup or 0) + (ciclo_seg or 0) * (unidades_op or 0) / 60
+        # Lead time: la estadía real en la etapa; si no hay, proceso + espera
+        lead_time = estadia
+        if lead_time is None and proceso is not None:
+            lead_time = proceso + (espera or 0)
+        elif lead_time is not None and proceso is not None:
+            proceso = min(proceso, lead_time)  # el proceso no puede durar más que la estadía
+
+        personas = numero(etapa.get("personas_asignadas"), 1) or 1
+        disponible = numero(etapa.get("horas_trabajo")) * 60 * numero(etapa.get("eficiencia_esperada"), 100) / 100
+        demanda_diaria = cantidad["suma"] / cantidad["dias"] if cantidad and cantidad["dias"] else None
+        takt = disponible / demanda_diaria if disponible and demanda_diaria else None
+        ciclo_efectivo = ciclo_seg / 60 / personas if ciclo_seg is not None else None  # min por unidad
+        carga = ciclo_efectivo / takt if takt and ciclo_efectivo is not None else None
+
+        mt = _fila(resumenes, "mt_utilizada", nombre)
+        merma = _fila(resumenes, "merma", nombre)
+        filas.append({
+            "etapa": nombre,
+            "ops": max((f["conteo"] for f in (_fila(resumenes, m, nombre) for m in METRICAS) if f), default=0),
+            "setup_min": setup,
+            "ciclo_seg": ciclo_seg,
+            "espera_min": espera,
+            "proceso_min": proceso,
+            "lead_time_min": lead_time,
+            "takt_min": takt,
+            "ciclo_efectivo_min": ciclo_efectivo,
+            "carga": carga,
+            "merma_pct": merma["suma"] / mt["suma"] * 100 if merma and mt and mt["suma"] else None,
+            "personas_promedio": _promedio(resumenes, "personas", nombre),
+        })
+
+    proceso_total = sum(f["proceso_min"] or 0 for f in filas)
+    lead_time_total = sum(f["lead_time_min"] or 0 for f in filas)
+
+    # Cuello de botella: mayor carga contra el takt; sin takt, mayor tiempo de proceso
+    con_carga = [f for f in filas if f["carga"] is not None]
+    if con_carga:
+        cuello = max(con_carga, key=lambda f: f["carga"])["etapa"]
+    else:
+        con_proceso = [f for f in filas if f["proceso_min"]]
+        cuello = max(con_proceso, key=lambda f: f["proceso_min"])["etapa"] if con_proceso else None
+
+    return {
+        "etapas": filas,
+        "tiempo_proceso_total_min": proceso_total,
+        "lead_time_total_min": lead_time_total,
+        "ratio_valor_agregado": proceso_total / lead_time_total if lead_time_total else None,
+        "cuello_botella": cuello,
+    }